@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult, execute
+from graphql.language import ast
+from graphql.language.parser import parse
+from graphql.validation import validate
+
+"""
+A GraphQL backend which caches parsed and validated documents, so that queries which
+are sent repeatedly (as is the case for most of our clients) are only parsed and
+validated against the schema once.
+"""
+
+DEFAULT_MAX_SIZE = 1000
+
+
+def execute_validated(schema, document_ast, validation_errors, *args, **kwargs):
+    """ Executes a document which has already been validated against `schema`. """
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+
+    """ Keeps the `max_size` most recently used documents, along with the errors found
+    when validating them. Documents are keyed by the schema and a hash of the query
+    string. Documents which can not be parsed are not cached. Safe to share between
+    threads. """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, executor=None):
+        super().__init__(executor=executor)
+        self.max_size = max_size
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_document_key(self, schema, document_string):
+        return (schema, hashlib.sha256(document_string.encode("utf-8")).hexdigest())
+
+    def create_document(self, schema, document_string):
+        document_ast = parse(document_string)
+        validation_errors = validate(schema, document_ast)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(
+                execute_validated,
+                schema,
+                document_ast,
+                validation_errors,
+                **self.execute_params
+            ),
+        )
+        document.validation_errors = validation_errors
+        return document
+
+    def document_from_string(self, schema, document_string):
+        if isinstance(document_string, ast.Document):
+            return super().document_from_string(schema, document_string)
+        assert isinstance(document_string, str), "The query must be a string"
+        key = self.get_document_key(schema, document_string)
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+        # Parsing and validation happen outside of the lock, so that slow documents do
+        # not hold up other threads. At worst, a document is created twice.
+        document = self.create_document(schema, document_string)
+        with self.lock:
+            self.documents[key] = document
+            self.documents.move_to_end(key)
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+        return document
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.hits = 0
+            self.misses = 0
@@ -1,20 +1,91 @@
+import hashlib
+from collections import defaultdict, namedtuple
 from functools import partial
+from operator import attrgetter
 
 import graphene
-from cursor_pagination import CursorPaginator
-from django.db.models import QuerySet
-from graphene.relay.connection import Iterable, PageInfo, connection_from_list
+from cursor_pagination import CursorPaginator, reverse_ordering
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models
+from django.db.models import F, QuerySet, Window
+from django.db.models.functions import RowNumber
+from graphene.relay.connection import (
+    Connection,
+    Iterable,
+    PageInfo,
+    connection_from_list,
+)
 from graphene.types.utils import get_type
 from graphene_django.filter import DjangoFilterConnectionField
 from graphene_django.utils import maybe_queryset
 from graphql_relay.utils import base64, is_str, unbase64
 from graphql_relay.connection.arrayconnection import connection_from_list_slice
 
+from .fields import is_default_resolver
+from .loaders import ConnectionPageLoader, get_loader
+from .optimizer import get_model_relations, get_node_selection, optimize_queryset
+from .permissions import get_permission_cache
+from .selections import get_fields
+
+# Number of rows fetched from the database at a time when loading a page
+CONNECTION_CHUNK_SIZE = 500
+
 
 def OrderByField(required=True):
     return graphene.List(of_type=graphene.String, required=required)
 
 
+def get_queryset_count(qs, cache_timeout=None):
+    """ Counts the items in `qs`. If `cache_timeout` is set, the count is cached for that
+    many seconds. Cached counts are keyed on the SQL for `qs`, so querysets filtered for
+    different users or arguments are counted separately. """
+    if not cache_timeout:
+        return qs.count()
+    try:
+        sql, params = qs.query.get_compiler(using=qs.db).as_sql()
+    except EmptyResultSet:
+        return 0
+    key = "graphene_django_plus:count:{}".format(
+        hashlib.sha256(f"{qs.db}:{sql}:{params}".encode("utf-8")).hexdigest()
+    )
+    count = cache.get(key)
+    if count is None:
+        count = qs.count()
+        cache.set(key, count, cache_timeout)
+    return count
+
+
+class PermissionedConnection(Connection):
+
+    """ Connection used by `PermissionedType`. The total number of items (`length`) is
+    only counted if it is actually used, e.g. when `totalCount` is requested, as counting
+    permission-filtered querysets can be expensive. Set `count_cache_timeout` on the
+    type's Meta to cache counts for that many seconds. """
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(
+        description="Total number of items in the connection, ignoring pagination."
+    )
+
+    @property
+    def length(self):
+        if not hasattr(self, "_length"):
+            if isinstance(self.iterable, QuerySet):
+                self._length = get_queryset_count(
+                    self.iterable,
+                    getattr(self._meta.node, "count_cache_timeout", None),
+                )
+            else:
+                self._length = len(self.iterable)
+        return self._length
+
+    def resolve_total_count(self, info):
+        return self.length
+
+
 class PermissionedConnectionField(DjangoFilterConnectionField):
 
     """ 
@@ -55,15 +126,27 @@ class PermissionedConnectionField(DjangoFilterConnectionField):
         **args
     ):
 
-        qs = default_manager.get_queryset()
+        # Viewable querysets are cached for the request, so they are only built once
+        # no matter how many times this connection appears in the query.
+        qs = get_permission_cache(info.context).get_viewable(
+            permission_class, default_manager, info.context.user
+        )
 
         ordering = args["orderBy"]
         qs = cls.order_queryset(qs, ordering)
 
-        permission = permission_class()
-        permission.queryset = qs
+        qs = cls.optimize_queryset(qs, connection, info)
 
-        qs = permission.get_viewable(info.context.user)
+        relation = cls.get_batchable_relation(resolver, connection, qs, root, args)
+        if relation:
+            cls.check_pagination_args(info, args, max_limit, enforce_first_or_last)
+            filter_kwargs = {k: v for k, v in args.items() if k in filtering_args}
+            qs = filterset_class(
+                data=filter_kwargs, queryset=qs, request=info.context
+            ).qs
+            return cls.resolve_batched_connection(
+                connection, qs, relation, root, info, args
+            )
 
         # Super method expects a manager, so just create one
         class Manager(object):
@@ -83,8 +166,97 @@ class PermissionedConnectionField(DjangoFilterConnectionField):
             **args
         )
 
+    @classmethod
+    def optimize_queryset(cls, qs, connection, info):
+        """ Uses the fields requested on each node to load related instances
+        alongside the nodes themselves. Override this to customise how the
+        queryset is optimized. """
+        return optimize_queryset(
+            qs, connection._meta.node, get_node_selection(get_fields(info))
+        )
+
+    @classmethod
+    def check_pagination_args(cls, info, args, max_limit, enforce_first_or_last):
+        """ Copied from `DjangoConnectionField.connection_resolver`, for connections
+        which are resolved without calling it. """
+        first = args.get("first")
+        last = args.get("last")
+
+        if enforce_first_or_last:
+            assert first or last, (
+                "You must provide a `first` or `last` value to properly paginate the `{}` connection."
+            ).format(info.field_name)
+
+        if max_limit:
+            if first:
+                assert first <= max_limit, (
+                    "Requesting {} records on the `{}` connection exceeds the `first` limit of {} records."
+                ).format(first, info.field_name, max_limit)
+                args["first"] = min(first, max_limit)
+
+            if last:
+                assert last <= max_limit, (
+                    "Requesting {} records on the `{}` connection exceeds the `last` limit of {} records."
+                ).format(last, info.field_name, max_limit)
+                args["last"] = min(last, max_limit)
+
+    @classmethod
+    def get_batchable_relation(cls, resolver, connection, qs, root, args):
+        """ Returns the many to many or reverse foreign key relation between `root` and
+        the nodes of this connection, if the connection can be resolved together with
+        the same connection on every other parent at this level of the query. """
+        if not isinstance(root, models.Model) or not is_default_resolver(resolver):
+            return None
+        if not (args.get("first") or args.get("last")):
+            return None
+        if not connections[qs.db].features.supports_over_clause:
+            return None
+        relation = get_model_relations(type(root)).get(resolver.args[0])
+        if isinstance(relation, models.OneToOneRel) or not isinstance(
+            relation, (models.ManyToOneRel, models.ManyToManyRel, models.ManyToManyField)
+        ):
+            return None
+        if relation.related_model is not connection._meta.node._meta.model:
+            return None
+        if (
+            isinstance(relation, models.ManyToOneRel)
+            and not relation.field.target_field.primary_key
+        ):
+            return None
+        return relation
+
+    @classmethod
+    def resolve_batched_connection(cls, connection, qs, relation, root, info, args):
+        """ Resolves the page of the connection belonging to `root`. Pages for every
+        parent at this level of the query are loaded together (see `get_connection_pages`). """
+        lookup = relation.remote_field.name
+        loader = get_loader(
+            info,
+            ("connection", id(info.field_asts[0]), repr(sorted(args.items()))),
+            lambda: ConnectionPageLoader(
+                partial(
+                    get_connection_pages, qs, lookup, type(root)._meta.pk, args=args
+                )
+            ),
+        )
+        def build_connection(page):
+            iterable = qs.filter(**{lookup: root.pk})
+            _connection = connection_from_page(
+                page,
+                args["orderBy"],
+                connection_type=connection,
+                edge_type=connection.Edge,
+                pageinfo_type=PageInfo,
+            )
+            _connection.iterable = iterable
+            if not isinstance(_connection, PermissionedConnection):
+                _connection.length = iterable.count()
+            return _connection
+
+        return loader.load(root.pk).then(build_connection)
+
     def get_resolver(self, parent_resolver):
-        return partial(
+        resolver = partial(
             self.connection_resolver,
             parent_resolver,
             self.type,
@@ -95,6 +267,9 @@ class PermissionedConnectionField(DjangoFilterConnectionField):
             self.filtering_args,
             self.permission_class,
         )
+        # Read when estimating the cost of queries (see `cost.QueryCostAnalyzer`)
+        resolver.max_limit = self.max_limit
+        return resolver
 
     @classmethod
     def resolve_connection(cls, connection, default_manager, args, iterable):
@@ -102,13 +277,9 @@ class PermissionedConnectionField(DjangoFilterConnectionField):
         if iterable is None:
             iterable = default_manager
         iterable = maybe_queryset(iterable)
-        if isinstance(iterable, QuerySet):
-            if iterable is not default_manager:
-                default_queryset = maybe_queryset(default_manager)
-                iterable = cls.merge_querysets(default_queryset, iterable)
-            _len = iterable.count()
-        else:
-            _len = len(iterable)
+        if isinstance(iterable, QuerySet) and iterable is not default_manager:
+            default_queryset = maybe_queryset(default_manager)
+            iterable = cls.merge_querysets(default_queryset, iterable)
         connection = connection_from_queryset(
             iterable,
             args,
@@ -117,7 +288,10 @@ class PermissionedConnectionField(DjangoFilterConnectionField):
             pageinfo_type=PageInfo,
         )
         connection.iterable = iterable
-        connection.length = _len
+        if not isinstance(connection, PermissionedConnection):
+            connection.length = (
+                iterable.count() if isinstance(iterable, QuerySet) else len(iterable)
+            )
         return connection
 
 
@@ -125,18 +299,105 @@ def get_paginator_for_queryset(qs, ordering):
     return CursorPaginator(qs, ordering=ordering)
 
 
+def get_cursor_encoder(ordering):
+    """ Returns a function which computes the cursor of an instance from the values of its
+    `ordering` attributes. The cursors are the same as those `CursorPaginator.cursor`
+    produces, but no paginator (or queryset) is needed. """
+    paths = [order.lstrip("-").replace("__", ".") for order in ordering]
+    get_position = attrgetter(*paths)
+    delimiter = CursorPaginator.delimiter
+
+    if len(paths) == 1:
+        return lambda instance: base64(str(get_position(instance)))
+
+    def encode_cursor(instance):
+        return base64(delimiter.join(map(str, get_position(instance))))
+
+    return encode_cursor
+
+
+def encode_cursor(instance, ordering):
+    return get_cursor_encoder(ordering)(instance)
+
+
+def iterate_queryset(qs, chunk_size=CONNECTION_CHUNK_SIZE):
+    """ Iterates over `qs` without caching its results on the queryset. Querysets which
+    prefetch related instances are iterated normally, as `iterator()` would ignore the
+    prefetches. """
+    if qs._prefetch_related_lookups:
+        return iter(qs)
+    return qs.iterator(chunk_size=chunk_size)
+
+
+def get_page(paginator, first=None, last=None, after=None, before=None):
+    """ Equivalent to `paginator.page`, but fetches the rows of the page in chunks rather
+    than holding both the queryset's result cache and a copy of it. """
+    qs = paginator.queryset
+    page_size = first or last
+    if page_size is None:
+        return ConnectionPage(list(iterate_queryset(qs)), False, False)
+
+    if after is not None:
+        qs = paginator.apply_cursor(after, qs)
+    if before is not None:
+        qs = paginator.apply_cursor(before, qs, reverse=True)
+    if first is not None:
+        qs = qs[: first + 1]
+    if last is not None:
+        if first is not None:
+            raise ValueError("Cannot process first and last")
+        qs = qs.order_by(*reverse_ordering(paginator.ordering))[: last + 1]
+
+    items = list(iterate_queryset(qs))
+    has_additional = len(items) > page_size
+    del items[page_size:]
+    if last is not None:
+        items.reverse()
+    if first is not None:
+        return ConnectionPage(items, bool(after), has_additional)
+    return ConnectionPage(items, has_additional, bool(before))
+
+
+class CompactEdge(object):
+
+    """ Used in place of graphene edge instances for connections with many edges. Holds no
+    more than the node, and only encodes its cursor if the cursor is requested. """
+
+    __slots__ = ("node", "get_cursor")
+
+    def __init__(self, node, get_cursor):
+        self.node = node
+        self.get_cursor = get_cursor
+
+    @property
+    def cursor(self):
+        return self.get_cursor(self.node)
+
+
 def connection_from_queryset(qs, args, connection_type, edge_type, pageinfo_type):
     """ NOTE: Ordering used needs to uniquely determine position of each item in the 
     set. e.g. ordering by name alone may not (unless names are unique), but ordering with name and ID will. """
     ordering = args["orderBy"]
     paginator = get_paginator_for_queryset(qs, ordering)
-    page = paginator.page(
+    page = get_page(
+        paginator,
         first=args.get("first"),
         last=args.get("last"),
         before=args.get("before"),
         after=args.get("after"),
     )
-    edges = [edge_type(node=node, cursor=paginator.cursor(node)) for node in page.items]
+    return connection_from_page(
+        page, ordering, connection_type, edge_type, pageinfo_type
+    )
+
+
+def connection_from_page(page, ordering, connection_type, edge_type, pageinfo_type):
+    get_cursor = get_cursor_encoder(ordering)
+    if set(edge_type._meta.fields) <= {"node", "cursor"}:
+        edges = [CompactEdge(node, get_cursor) for node in page.items]
+    else:
+        # Custom edge types may rely on being instantiated
+        edges = [edge_type(node=node, cursor=get_cursor(node)) for node in page.items]
     first_edge_cursor = edges[0].cursor if edges else None
     last_edge_cursor = edges[-1].cursor if edges else None
     return connection_type(
@@ -148,3 +409,95 @@ def connection_from_queryset(qs, args, connection_type, edge_type, pageinfo_type
             has_next_page=page.has_next,
         ),
     )
+
+
+# Same interface as the pages returned by `CursorPaginator`
+ConnectionPage = namedtuple("ConnectionPage", ["items", "has_previous", "has_next"])
+
+
+def _get_order_expression(order):
+    if order.startswith("-"):
+        return F(order[1:]).desc()
+    return F(order).asc()
+
+
+def get_connection_pages(qs, lookup, parent_pk_field, parent_keys, args):
+    """ Returns a `ConnectionPage` of `qs` for each parent in `parent_keys`, where `lookup`
+    relates items in `qs` to their parent and `parent_pk_field` is the parent's primary key.
+    Each parent is paginated separately using the `first`, `last`, `after`, `before` and
+    `orderBy` values in `args`, exactly as `CursorPaginator` would. However, the items on
+    every page are found with one windowed query (`ROW_NUMBER() OVER (PARTITION BY parent)`)
+    and then fetched with a second query, rather than with two queries per parent. """
+    ordering = args["orderBy"]
+    first = args.get("first")
+    last = args.get("last")
+    after = args.get("after")
+    before = args.get("before")
+    if first is not None and last is not None:
+        raise ValueError("Cannot process first and last")
+    page_size = first or last
+
+    paginator = get_paginator_for_queryset(qs, ordering)
+    page_qs = paginator.queryset
+    if page_qs.query.distinct:
+        # Row numbers are assigned before DISTINCT is applied, so remove any duplicates
+        # introduced by permission filtering first.
+        page_qs = qs.model._default_manager.filter(pk__in=qs.values("pk"))
+    page_qs = page_qs.filter(**{f"{lookup}__in": parent_keys})
+    if after is not None:
+        page_qs = paginator.apply_cursor(after, page_qs)
+    if before is not None:
+        page_qs = paginator.apply_cursor(before, page_qs, reverse=True)
+    page_ordering = ordering if last is None else reverse_ordering(ordering)
+    rows_qs = (
+        page_qs.annotate(
+            _parent_key=F(lookup),
+            _row_number=Window(
+                RowNumber(),
+                partition_by=[F(lookup)],
+                order_by=[_get_order_expression(order) for order in page_ordering],
+            ),
+        )
+        .order_by()
+        .values_list("pk", "_parent_key", "_row_number")
+    )
+
+    rows = []
+    try:
+        sql, params = rows_qs.query.get_compiler(using=rows_qs.db).as_sql()
+    except EmptyResultSet:
+        pass
+    else:
+        # Fetch one more row than needed for each parent, to determine whether there
+        # are more pages.
+        with connections[rows_qs.db].cursor() as cursor:
+            cursor.execute(
+                f"SELECT * FROM ({sql}) page_rows WHERE page_rows._row_number <= %s",
+                (*params, page_size + 1),
+            )
+            rows = cursor.fetchall()
+
+    pk_field = qs.model._meta.pk
+    rows_by_parent = defaultdict(list)
+    for pk, parent_key, row_number in rows:
+        rows_by_parent[parent_pk_field.to_python(parent_key)].append(
+            (row_number, pk_field.to_python(pk))
+        )
+    pks = {pk for page_rows in rows_by_parent.values() for _, pk in page_rows}
+    instances = qs.in_bulk(pks) if pks else {}
+
+    pages = {}
+    for parent_key in parent_keys:
+        page_rows = sorted(rows_by_parent[parent_key])
+        items = [instances[pk] for _, pk in page_rows[:page_size] if pk in instances]
+        has_additional = len(page_rows) > page_size
+        if last is not None:
+            items.reverse()
+            pages[parent_key] = ConnectionPage(
+                items, has_previous=has_additional, has_next=bool(before)
+            )
+        else:
+            pages[parent_key] = ConnectionPage(
+                items, has_previous=bool(after), has_next=has_additional
+            )
+    return pages
@@ -68,7 +68,10 @@ def convert_field_to_djangomodel(field, registry=None):
         if not _type:
             return
         return PermissionedTypeField(
-            _type, description=field.help_text, required=not field.null
+            _type,
+            description=field.help_text,
+            required=not field.null,
+            model_field=field,
         )
 
     return Dynamic(dynamic_type)
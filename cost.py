@@ -0,0 +1,160 @@
+from graphene.relay import Connection
+from graphene_django.settings import graphene_settings
+from graphql.error import GraphQLError
+from graphql.language import ast
+from graphql.type.definition import get_named_type
+from graphql.utils.value_from_ast import value_from_ast
+
+"""
+Static analysis of the cost of a query, used to reject queries which would load too many
+instances before they are executed. Each object in the result costs the `cost_weight` of its
+type (1 by default, see `PermissionedType`), multiplied by the size of every connection it is
+nested in. Connection sizes are taken from their `first` or `last` arguments, falling back to
+the `max_limit` of the connection field, then to `RELAY_CONNECTION_MAX_LIMIT`.
+"""
+
+# Size assumed for connections if no limit has been configured
+DEFAULT_CONNECTION_SIZE = 100
+
+
+class QueryCostError(GraphQLError):
+    def __init__(self, cost, max_cost):
+        super().__init__(
+            "Query cost of {} exceeds the maximum allowed cost of {}. Request fewer "
+            "items from connections, or split the query up.".format(cost, max_cost)
+        )
+        self.cost = cost
+        self.max_cost = max_cost
+
+
+def get_operation(document_ast, operation_name=None):
+    operations = [
+        definition
+        for definition in document_ast.definitions
+        if isinstance(definition, ast.OperationDefinition)
+    ]
+    if operation_name is None:
+        return operations[0] if len(operations) == 1 else None
+    for operation in operations:
+        if operation.name and operation.name.value == operation_name:
+            return operation
+    return None
+
+
+def get_type_weight(type_):
+    graphene_type = getattr(type_, "graphene_type", None)
+    if hasattr(graphene_type, "cost_weight"):
+        return graphene_type.cost_weight
+    # Only types backed by a model load anything from the database
+    return 1 if getattr(getattr(graphene_type, "_meta", None), "model", None) else 0
+
+
+def is_connection_type(type_):
+    graphene_type = getattr(type_, "graphene_type", None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+
+
+class QueryCostAnalyzer(object):
+
+    """ Computes the cost of an operation in a (validated) document. Fields which do not
+    exist in the schema are ignored. """
+
+    def __init__(self, schema, document_ast, variables=None, default_limit=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.default_limit = (
+            default_limit
+            or graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+            or DEFAULT_CONNECTION_SIZE
+        )
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+
+    def get_operation_cost(self, operation):
+        if operation.operation == "mutation":
+            root_type = self.schema.get_mutation_type()
+        elif operation.operation == "subscription":
+            root_type = self.schema.get_subscription_type()
+        else:
+            root_type = self.schema.get_query_type()
+        if root_type is None:
+            return 0
+        return self.get_selection_cost(root_type, operation.selection_set, 1, set())
+
+    def get_connection_size(self, field_def, field_ast):
+        """ Returns the number of items requested from a connection. Sizes requested by
+        the client are used as they are, as connections reject sizes over their limit. """
+        size = None
+        for argument in field_ast.arguments or []:
+            name = argument.name.value
+            if name not in ("first", "last") or name not in field_def.args:
+                continue
+            value = value_from_ast(
+                argument.value, field_def.args[name].type, self.variables
+            )
+            if value is not None:
+                size = max(size or 0, value)
+        if size is not None:
+            return size
+        return getattr(field_def.resolver, "max_limit", None) or self.default_limit
+
+    def get_selection_cost(self, parent_type, selection_set, multiplier, visited):
+        if selection_set is None:
+            return 0
+        cost = 0
+        fields = getattr(parent_type, "fields", None) or {}
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                field_def = fields.get(selection.name.value)
+                if field_def is None:
+                    continue
+                field_type = get_named_type(field_def.type)
+                if selection.selection_set is None:
+                    continue
+                field_multiplier = multiplier
+                if is_connection_type(field_type):
+                    field_multiplier *= self.get_connection_size(field_def, selection)
+                else:
+                    cost += multiplier * get_type_weight(field_type)
+                cost += self.get_selection_cost(
+                    field_type, selection.selection_set, field_multiplier, visited
+                )
+            elif isinstance(selection, ast.InlineFragment):
+                type_ = parent_type
+                if selection.type_condition:
+                    type_ = self.schema.get_type(selection.type_condition.name.value)
+                cost += self.get_selection_cost(
+                    type_, selection.selection_set, multiplier, visited
+                )
+            elif isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                # Fragment cycles are reported by validation
+                if fragment is None or name in visited:
+                    continue
+                type_ = self.schema.get_type(fragment.type_condition.name.value)
+                cost += self.get_selection_cost(
+                    type_, fragment.selection_set, multiplier, visited | {name}
+                )
+        return cost
+
+
+def get_query_cost(schema, document_ast, operation_name=None, variables=None):
+    operation = get_operation(document_ast, operation_name)
+    if operation is None:
+        return 0
+    return QueryCostAnalyzer(schema, document_ast, variables).get_operation_cost(
+        operation
+    )
+
+
+def check_query_cost(schema, document_ast, max_cost, operation_name=None, variables=None):
+    """ Raises a `QueryCostError` if the cost of the operation exceeds `max_cost`.
+    Returns the cost otherwise. """
+    cost = get_query_cost(schema, document_ast, operation_name, variables)
+    if cost > max_cost:
+        raise QueryCostError(cost, max_cost)
+    return cost
@@ -0,0 +1,32 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+JSON encoding of GraphQL responses. Uses orjson when it is installed, which is several times
+faster than the standard library for large responses, and a standard library encoder set up
+for compact output otherwise.
+"""
+
+# Results are trees, so checking for cycles is wasted work
+_stdlib_encoder = json.JSONEncoder(separators=(",", ":"), check_circular=False)
+
+
+def stdlib_json_dumps(data):
+    return _stdlib_encoder.encode(data)
+
+
+def fast_json_dumps(data):
+    """ Encodes `data` as compact JSON. Returns UTF-8 encoded bytes when orjson is used,
+    so that they are not decoded only to be encoded again, and a string otherwise. """
+    if orjson is None:
+        return stdlib_json_dumps(data)
+    try:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # Raised for values orjson does not support, such as integers larger than 64
+        # bits, which the standard library can still encode
+        return stdlib_json_dumps(data)
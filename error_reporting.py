@@ -0,0 +1,161 @@
+import logging
+import queue
+import random
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from raven.contrib.django.raven_compat.models import client as sentry_client
+
+"""
+Reports the errors raised while executing GraphQL requests to Sentry from a background
+thread, so that request latency does not depend on how many errors there are. Errors with
+the same fingerprint (the type of the error and the path of the field which raised it) are
+only reported once per `dedupe_window`, and only `sample_rate` of the remaining errors are
+reported at all. Errors are dropped if the queue is full.
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEDUPE_WINDOW = 60
+DEFAULT_MAX_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 50
+# Expired fingerprints are only forgotten once there are more than this many
+MAX_FINGERPRINTS = 10000
+
+
+def get_original_error(error):
+    return getattr(error, "original_error", None) or error
+
+
+def get_fingerprint(error):
+    path = getattr(error, "path", None) or ()
+    return (
+        type(get_original_error(error)).__name__,
+        ".".join(str(key) for key in path if not isinstance(key, int)),
+    )
+
+
+class ErrorReporter(object):
+
+    """ Queues errors to be reported by a worker thread, which is started when the first
+    error is reported. `dropped` counts the errors which did not fit in the queue. """
+
+    def __init__(
+        self,
+        client=sentry_client,
+        sample_rate=1.0,
+        dedupe_window=DEFAULT_DEDUPE_WINDOW,
+        max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+        batch_size=DEFAULT_BATCH_SIZE,
+        print_tracebacks=True,
+    ):
+        self.client = client
+        self.sample_rate = sample_rate
+        self.dedupe_window = dedupe_window
+        self.batch_size = batch_size
+        self.print_tracebacks = print_tracebacks
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        # Maps fingerprints onto when they were last reported, and how many errors with
+        # the fingerprint have been suppressed since
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def should_report(self, fingerprint, now):
+        """ Returns whether an error with `fingerprint` should be reported, along with the
+        number of duplicates which were suppressed since it was last reported. """
+        with self.lock:
+            seen = self.fingerprints.get(fingerprint)
+            if seen is not None and now - seen[0] < self.dedupe_window:
+                seen[1] += 1
+                return False, 0
+            if len(self.fingerprints) >= MAX_FINGERPRINTS:
+                self.fingerprints = {
+                    key: value
+                    for key, value in self.fingerprints.items()
+                    if now - value[0] < self.dedupe_window
+                }
+            self.fingerprints[fingerprint] = [now, 0]
+        suppressed = seen[1] if seen is not None else 0
+        return random.random() < self.sample_rate, suppressed
+
+    def get_request_data(self, request):
+        """ Returns the details of `request` (URL, headers, user, etc.) to send with its
+        errors. Read on the request thread, as the client's own request context is not
+        available to the worker. """
+        get_data_from_request = getattr(self.client, "get_data_from_request", None)
+        if request is None or get_data_from_request is None:
+            return None
+        try:
+            return get_data_from_request(request)
+        except Exception:
+            logger.exception("Could not read the details of a GraphQL request.")
+            return None
+
+    def report(self, error, request=None):
+        """ Queues `error` (usually a `GraphQLError` wrapping the original exception), which
+        was raised while handling `request`, to be reported. Returns immediately. """
+        fingerprint = get_fingerprint(error)
+        report, suppressed = self.should_report(fingerprint, time.monotonic())
+        if not report:
+            return
+        original = get_original_error(error)
+        exc_info = (type(original), original, original.__traceback__)
+        data = self.get_request_data(request)
+        try:
+            self.queue.put_nowait((exc_info, fingerprint, suppressed, data))
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.ensure_worker()
+
+    def ensure_worker(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(
+                    target=self.run, name="graphql-error-reporter", daemon=True
+                )
+                self.worker.start()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.submit(batch)
+            except Exception:
+                logger.exception("Could not report GraphQL errors.")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def submit(self, batch):
+        for exc_info, fingerprint, suppressed, data in batch:
+            if self.print_tracebacks:
+                print("Exception was caught by GraphQL Core. Original error:")
+                print("".join(traceback.format_exception(*exc_info)))
+            self.client.captureException(
+                exc_info=exc_info,
+                data=data,
+                fingerprint=list(fingerprint),
+                extra={"field_path": fingerprint[1], "suppressed_duplicates": suppressed},
+            )
+
+    def flush(self):
+        """ Waits until every queued error has been reported. """
+        self.queue.join()
+
+
+error_reporter = ErrorReporter(
+    sample_rate=getattr(settings, "GRAPHQL_ERROR_SAMPLE_RATE", 1.0),
+    dedupe_window=getattr(settings, "GRAPHQL_ERROR_DEDUPE_WINDOW", DEFAULT_DEDUPE_WINDOW),
+)
@@ -8,7 +8,12 @@ from rest_framework_filters.filterset import FilterSet
 from .permissions import Permission
 from .serializers import ModelMutationSerializer
 from .types import PermissionedType
-from .mutations import PermissionedDeletionMutation, PermissionedSerializerMutation
+from .mutations import (
+    PermissionedBulkDeletionMutation,
+    PermissionedBulkSerializerMutation,
+    PermissionedDeletionMutation,
+    PermissionedSerializerMutation,
+)
 from .node import PermissionedConnectionField, PermissionedNode
 from .utils import (
     create_permissioned_connection_field_for_type,
@@ -20,6 +25,8 @@ RETRIEVE_FIELD_FORMAT = "{type_name}___Item"
 CREATE_MUTATION_FIELD = "{type_name}___Create"
 UPDATE_MUTATION_FIELD = "{type_name}___Update"
 DELETE_MUTATION_FIELD = "{type_name}___Delete"
+BULK_CREATE_OR_UPDATE_MUTATION_FIELD = "{type_name}___BulkCreateOrUpdate"
+BULK_DELETE_MUTATION_FIELD = "{type_name}___BulkDelete"
 
 
 def make_mutation_class(**kwargs):
@@ -33,11 +40,30 @@ def make_mutation_class(**kwargs):
         serializer_class = kwargs["serializer_class"]
         permission_class = kwargs["permission_class"]
         model_operations = kwargs["operation_names"]
+        permissioned_lookup = kwargs.get("permissioned_lookup", False)
+        select_for_update = kwargs.get("select_for_update", False)
 
     MutationType = type(type_name, (PermissionedSerializerMutation,), {"Meta": Meta})
     return MutationType
 
 
+def make_bulk_mutation_class(**kwargs):
+
+    type_name = f"BulkCreateOrUpdate{kwargs['model'].__name__}Mutation"
+
+    class Meta:
+        name = type_name
+        output_type = kwargs["output"]
+        serializer_class = kwargs["serializer_class"]
+        permission_class = kwargs["permission_class"]
+        model_operations = kwargs["operation_names"]
+
+    MutationType = type(
+        type_name, (PermissionedBulkSerializerMutation,), {"Meta": Meta}
+    )
+    return MutationType
+
+
 def make_delete_mutation_class(**kwargs):
 
     type_name = f"Delete{kwargs['model'].__name__}Mutation"
@@ -48,11 +74,28 @@ def make_delete_mutation_class(**kwargs):
         # output_type = kwargs["output"]
         # serializer_class = kwargs["serializer_class"]
         permission_class = kwargs["permission_class"]
+        permissioned_lookup = kwargs.get("permissioned_lookup", False)
+        select_for_update = kwargs.get("select_for_update", False)
 
     MutationType = type(type_name, (PermissionedDeletionMutation,), {"Meta": Meta})
     return MutationType
 
 
+def make_bulk_delete_mutation_class(**kwargs):
+
+    type_name = f"BulkDelete{kwargs['model'].__name__}Mutation"
+
+    class Meta:
+        name = type_name
+        model = kwargs.get("model")
+        permission_class = kwargs["permission_class"]
+
+    MutationType = type(
+        type_name, (PermissionedBulkDeletionMutation,), {"Meta": Meta}
+    )
+    return MutationType
+
+
 def make_subscription_class(**kwargs):
     type_name = f"{kwargs['model'].__name__}Subscription"
 
@@ -77,7 +120,9 @@ class PermissionedSchemaFieldsFactory(object):
     many `type` instances plus a {type}__Get field for retrieving a single
     `type` instance. MutationFieldsClass will return a mutation class with a 
     {type}__Create, {type}__Update and {type}__Delete fields depending on the
-    allowed operations specified in `mutation_operations`. 
+    allowed operations specified in `mutation_operations`. Adding "bulk_create_or_update"
+    to `mutation_operations` also adds a {type}___BulkCreateOrUpdate field, and
+    "bulk_delete" adds a {type}___BulkDelete field. 
     
     You can subclass any factory generated class to add additional fields relating
     to querying or mutating a given type. """
@@ -85,6 +130,10 @@ class PermissionedSchemaFieldsFactory(object):
     type_class: PermissionedType
     mutation_serializer_class: ModelMutationSerializer
     mutation_operations: list
+    # Fetch instances for update and delete mutations from the user's changeable /
+    # deletable querysets, optionally locking them. See `PermissionedSerializerMutation`.
+    mutation_permissioned_lookup = False
+    mutation_select_for_update = False
 
     @classmethod
     def _get_or_make(cls, attr_name, make_func):
@@ -154,6 +203,26 @@ class PermissionedSchemaFieldsFactory(object):
                 serializer_class=cls.mutation_serializer_class,
                 permission_class=cls.PermissionClass(),
                 operation_names=cls.mutation_operations,
+                permissioned_lookup=cls.mutation_permissioned_lookup,
+                select_for_update=cls.mutation_select_for_update,
+            ),
+        )
+
+    @classmethod
+    def BulkCreateOrUpdateMutationClass(cls):
+        # Bulk mutations can create and update instances, unless only one of those
+        # operations is allowed.
+        operation_names = [
+            name for name in ("create", "update") if name in cls.mutation_operations
+        ] or ["create", "update"]
+        return cls._get_or_make(
+            "_bulk_mutation_class",
+            lambda: make_bulk_mutation_class(
+                model=cls.get_model(),
+                output=cls.OutputTypeClass(),
+                serializer_class=cls.mutation_serializer_class,
+                permission_class=cls.PermissionClass(),
+                operation_names=operation_names,
             ),
         )
 
@@ -162,6 +231,18 @@ class PermissionedSchemaFieldsFactory(object):
         return cls._get_or_make(
             "_delete_mutation_type",
             lambda: make_delete_mutation_class(
+                model=cls.get_model(),
+                permission_class=cls.PermissionClass(),
+                permissioned_lookup=cls.mutation_permissioned_lookup,
+                select_for_update=cls.mutation_select_for_update,
+            ),
+        )
+
+    @classmethod
+    def BulkDeleteMutationClass(cls):
+        return cls._get_or_make(
+            "_bulk_delete_mutation_type",
+            lambda: make_bulk_delete_mutation_class(
                 model=cls.get_model(), permission_class=cls.PermissionClass()
             ),
         )
@@ -202,6 +283,19 @@ class PermissionedSchemaFieldsFactory(object):
                 cls.CreateAndUpdateMutationClass().Field(),
             )
 
+        if "bulk_create_or_update" in cls.mutation_operations:
+            bulk_mutation_field_name = BULK_CREATE_OR_UPDATE_MUTATION_FIELD.format(
+                type_name=type_name
+            )
+            # Named explicitly, as automatic camel casing would lower case "CreateOrUpdate"
+            setattr(
+                Mutation,
+                bulk_mutation_field_name,
+                cls.BulkCreateOrUpdateMutationClass().Field(
+                    name=bulk_mutation_field_name.replace("___", "__")
+                ),
+            )
+
         if "delete" in cls.mutation_operations:
             delete_mutation_field_name = DELETE_MUTATION_FIELD.format(
                 type_name=type_name
@@ -210,4 +304,16 @@ class PermissionedSchemaFieldsFactory(object):
                 Mutation, delete_mutation_field_name, cls.DeleteMutationClass().Field()
             )
 
+        if "bulk_delete" in cls.mutation_operations:
+            bulk_delete_mutation_field_name = BULK_DELETE_MUTATION_FIELD.format(
+                type_name=type_name
+            )
+            setattr(
+                Mutation,
+                bulk_delete_mutation_field_name,
+                cls.BulkDeleteMutationClass().Field(
+                    name=bulk_delete_mutation_field_name.replace("___", "__")
+                ),
+            )
+
         return Mutation
@@ -1,23 +1,74 @@
+from functools import partial
+
 from graphene import Field
+from graphene.types.resolver import get_default_resolver
+from promise import Promise
+
+from .loaders import get_instance_loader
+
+
+def is_default_resolver(resolver):
+    return (
+        isinstance(resolver, partial) and resolver.func is get_default_resolver()
+    )
 
 
 class PermissionedTypeField(Field):
-    def __init__(self, type, *args, **kwargs):
+    def __init__(self, type, *args, model_field=None, **kwargs):
         assert hasattr(
-            type, "ensure_user_can_view_instance"
+            type, "load_viewable_instance"
         ), "Types which are passed to PermissionField should sub-class `PermissionedType`"
         # Keep base_type, as it is used to do permissions check. `Field` class may wrap
         # `type` in a `NonNull` container.
         self.base_type = type
+        # Foreign key (or one to one field) which this field resolves, if any. Makes it
+        # possible to batch the loading of related instances.
+        self.model_field = model_field
         super().__init__(type, *args, **kwargs)
 
+    def load_related_instance(self, root, info):
+        """ Loads the instance `root` relates to via `model_field`. Instances requested
+        at the same level of the query are fetched together in a single query. """
+        field = self.model_field
+        value = getattr(root, field.attname)
+        if value is None:
+            return Promise.resolve(None)
+        loader = get_instance_loader(
+            info, field.related_model, field.remote_field.field_name
+        )
+
+        def cache_instance(inst):
+            # Saves further queries if the relation is accessed again later on.
+            if inst:
+                field.set_cached_value(root, inst)
+            return inst
+
+        return loader.load(value).then(cache_instance)
+
     def get_resolver(self, parent_resolver):
         res = super().get_resolver(parent_resolver)
+        # Instances can only be batch loaded if the field is resolved using the
+        # related model field, i.e. no custom resolver has been defined.
+        can_batch = (
+            self.model_field is not None
+            and res is parent_resolver
+            and is_default_resolver(parent_resolver)
+        )
 
-        def resolve_with_permission_check(root, info, **kwargs):
-            inst = res(root, info, **kwargs)
+        def check_permission(info, inst):
             if inst:
-                self.base_type.ensure_user_can_view_instance(info, inst)
+                return self.base_type.load_viewable_instance(info, inst)
             return inst
 
+        def resolve_with_permission_check(root, info, **kwargs):
+            if (
+                can_batch
+                and isinstance(root, self.model_field.model)
+                and not self.model_field.is_cached(root)
+            ):
+                return self.load_related_instance(root, info).then(
+                    partial(check_permission, info)
+                )
+            return check_permission(info, res(root, info, **kwargs))
+
         return resolve_with_permission_check
@@ -0,0 +1,283 @@
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+from .permissions import get_permission_cache
+
+"""
+Records where the time of a GraphQL request goes. `InstrumentationMiddleware` times each
+resolver, and counts the SQL queries it makes, the time spent executing them and the time
+spent in permission class methods. Stats are aggregated per field path (list indexes are
+left out, so every item of a list shares the stats of its field) and handed to the sinks of
+the middleware once the request completes. Views should call `finish_request` at the end
+of each request (`ExceptionHandlingGraphQLView` does). Otherwise, the profile is completed
+when the request is garbage collected.
+
+Resolvers which return promises are only timed until they return. Work done once the
+promises are resolved, such as batched loads, is recorded under `UNATTRIBUTED_PATH`.
+"""
+
+PROFILE_ATTR = "_graphene_django_plus_profile"
+UNATTRIBUTED_PATH = "(unattributed)"
+PERMISSION_METHODS = frozenset(
+    (
+        "get_viewable",
+        "get_changeable",
+        "get_deletable",
+        "can_view",
+        "can_add",
+        "can_change",
+        "can_delete",
+        "can_view_many",
+        "can_add_many",
+        "can_change_many",
+        "can_delete_many",
+    )
+)
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+class FieldStats(object):
+    __slots__ = ("calls", "time", "queries", "sql_time", "permission_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.permission_time = 0.0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RequestProfile(object):
+
+    """ The stats of each field path resolved during a request. """
+
+    def __init__(self, sinks=()):
+        self.sinks = sinks
+        self.fields = OrderedDict()
+        self.unattributed = FieldStats()
+        self.started_at = time.perf_counter()
+        # Set once the request is complete
+        self.duration = None
+        self.finalizer = None
+        # Added to the `extensions` of the response by `ExceptionHandlingGraphQLView`
+        self.extensions = {}
+
+    def get_stats(self, path):
+        stats = self.fields.get(path)
+        if stats is None:
+            stats = self.fields[path] = FieldStats()
+        return stats
+
+    @property
+    def totals(self):
+        totals = FieldStats()
+        for stats in list(self.fields.values()) + [self.unattributed]:
+            for name in FieldStats.__slots__:
+                setattr(totals, name, getattr(totals, name) + getattr(stats, name))
+        return totals
+
+    def as_dict(self):
+        fields = OrderedDict(
+            (path, stats.as_dict()) for path, stats in self.fields.items()
+        )
+        if self.unattributed.calls or self.unattributed.queries:
+            fields[UNATTRIBUTED_PATH] = self.unattributed.as_dict()
+        return {"duration": self.duration, "totals": self.totals.as_dict(), "fields": fields}
+
+
+def _get_current_stats():
+    stats = getattr(_state, "stats", None)
+    if stats is None:
+        # Only a weak reference is kept, so that queries are no longer recorded once the
+        # request is gone
+        profile_ref = getattr(_state, "profile", None)
+        profile = profile_ref() if profile_ref is not None else None
+        if profile is not None and profile.duration is None:
+            stats = profile.unattributed
+    return stats
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _get_current_stats()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_time += time.perf_counter() - start
+
+
+def _install_query_recorder():
+    # Stays installed on the connections of the thread, but does nothing unless a
+    # request is being profiled
+    for connection in connections.all():
+        if _record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_record_query)
+
+
+def _timed_call(method, *args, **kwargs):
+    stats = _get_current_stats()
+    if stats is None:
+        return method(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return method(*args, **kwargs)
+    finally:
+        stats.permission_time += time.perf_counter() - start
+
+
+class TimedPermission(object):
+
+    """ Wraps a permission instance, timing calls to its permission checks. """
+
+    def __init__(self, permission):
+        self._permission = permission
+
+    def __getattr__(self, name):
+        value = getattr(self._permission, name)
+        if name in PERMISSION_METHODS:
+            return partial(_timed_call, value)
+        return value
+
+
+def get_field_path(info):
+    return ".".join(str(key) for key in info.path if not isinstance(key, int))
+
+
+class InstrumentationMiddleware(object):
+
+    """ Graphene middleware which profiles requests, passing each profile to every one of
+    `sinks` once the request completes. """
+
+    def __init__(self, sinks=None):
+        self.sinks = sinks if sinks is not None else [LoggingSink()]
+
+    def get_profile(self, context):
+        profile = getattr(context, PROFILE_ATTR, None)
+        if profile is None:
+            profile = RequestProfile(self.sinks)
+            setattr(context, PROFILE_ATTR, profile)
+            profile.finalizer = weakref.finalize(context, _complete_profile, profile)
+            _state.profile = weakref.ref(profile)
+            _install_query_recorder()
+        # Checked every time, as the permission cache may be replaced during a request
+        permission_cache = get_permission_cache(context)
+        if permission_cache.permission_wrapper is None:
+            permission_cache.permission_wrapper = TimedPermission
+        return profile
+
+    def resolve(self, next, root, info, **args):
+        stats = self.get_profile(info.context).get_stats(get_field_path(info))
+        previous = getattr(_state, "stats", None)
+        _state.stats = stats
+        start = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            stats.calls += 1
+            stats.time += time.perf_counter() - start
+            _state.stats = previous
+
+
+def finish_request(context):
+    """ Completes the profile of the request `context` and passes it to its sinks. Returns
+    the profile, or `None` if the request was not profiled. """
+    profile = getattr(context, PROFILE_ATTR, None)
+    if profile is None:
+        return None
+    delattr(context, PROFILE_ATTR)
+    profile.finalizer.detach()
+    _complete_profile(profile)
+    return profile
+
+
+def _complete_profile(profile):
+    profile.duration = time.perf_counter() - profile.started_at
+    for sink in profile.sinks:
+        try:
+            sink.record(profile)
+        except Exception:
+            logger.exception("Could not record the profile of a GraphQL request.")
+
+
+class LoggingSink(object):
+
+    """ Logs a summary of each request which took at least `min_duration` seconds,
+    listing its `limit` slowest field paths. """
+
+    def __init__(self, logger=logger, level=logging.INFO, min_duration=0, limit=10):
+        self.logger = logger
+        self.level = level
+        self.min_duration = min_duration
+        self.limit = limit
+
+    def record(self, profile):
+        if profile.duration < self.min_duration:
+            return
+        totals = profile.totals
+        lines = [
+            "GraphQL request took {:.1f}ms, {} queries ({:.1f}ms), {:.1f}ms in permissions".format(
+                profile.duration * 1000,
+                totals.queries,
+                totals.sql_time * 1000,
+                totals.permission_time * 1000,
+            )
+        ]
+        slowest = sorted(profile.fields.items(), key=lambda item: -item[1].time)
+        for path, stats in slowest[: self.limit]:
+            lines.append(
+                "  {}: {} calls, {:.1f}ms, {} queries ({:.1f}ms), {:.1f}ms in permissions".format(
+                    path,
+                    stats.calls,
+                    stats.time * 1000,
+                    stats.queries,
+                    stats.sql_time * 1000,
+                    stats.permission_time * 1000,
+                )
+            )
+        self.logger.log(self.level, "\n".join(lines))
+
+
+class RingBufferSink(object):
+
+    """ Keeps the profiles of the `max_size` most recent requests in `profiles`. """
+
+    def __init__(self, max_size=100):
+        self.profiles = deque(maxlen=max_size)
+        self.lock = threading.Lock()
+
+    def record(self, profile):
+        with self.lock:
+            self.profiles.append(profile)
+
+    def get_profiles(self):
+        with self.lock:
+            return list(self.profiles)
+
+
+class ExtensionsSink(object):
+
+    """ Adds the profile to the `extensions` of the response, under `profile`. Only
+    does so when `DEBUG` is on, unless `debug_only` is unset. """
+
+    def __init__(self, debug_only=True):
+        self.debug_only = debug_only
+
+    def record(self, profile):
+        if settings.DEBUG or not self.debug_only:
+            profile.extensions["profile"] = profile.as_dict()
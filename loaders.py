@@ -0,0 +1,110 @@
+from promise import Promise
+from promise.dataloader import DataLoader
+
+"""
+DataLoaders used to batch the database queries made while resolving a request.
+Loaders are stored on the request (i.e. `info.context`) so that they are shared by
+every resolver in that request, but never between requests or users.
+"""
+
+LOADERS_ATTR = "_graphene_django_plus_loaders"
+
+
+def get_loader(info, key, make_loader):
+    """ Returns the loader stored on the current request under `key`. `make_loader`
+    is called to create the loader the first time it is requested. """
+    loaders = getattr(info.context, LOADERS_ATTR, None)
+    if loaders is None:
+        loaders = {}
+        setattr(info.context, LOADERS_ATTR, loaders)
+    if key not in loaders:
+        loaders[key] = make_loader()
+    return loaders[key]
+
+
+class InstanceLoader(DataLoader):
+
+    """ Loads `model` instances using the value of `field_name` (the primary key by
+    default). Every instance requested at one level of the query is fetched with a
+    single `__in` query, made against `queryset` if it is given. Resolves to `None`
+    for values which have no matching instance. """
+
+    def __init__(self, model, field_name=None, queryset=None):
+        super().__init__()
+        self.model = model
+        self.field_name = field_name or model._meta.pk.name
+        self.queryset = queryset if queryset is not None else model._default_manager
+
+    def batch_load_fn(self, keys):
+        instances = self.queryset.in_bulk(keys, field_name=self.field_name)
+        return Promise.resolve([instances.get(key) for key in keys])
+
+
+def get_instance_loader(info, model, field_name=None):
+    """ Returns the loader for instances related to via a foreign key. Like Django's
+    related descriptors, it uses the base manager, so rows hidden by the default manager
+    (e.g. soft deleted ones) are still found. """
+    return get_loader(
+        info,
+        ("instance", model, field_name),
+        lambda: InstanceLoader(model, field_name, queryset=model._base_manager),
+    )
+
+
+class VisibilityLoader(DataLoader):
+
+    """ Determines whether `user` can view instances according to `permission_class`.
+    Resolves to `True` or `False` for each instance. The visibility of every instance
+    requested at one level of the query is checked with a single call to
+    `can_view_many`, going through the request's permission cache. """
+
+    def __init__(self, permission_cache, permission_class, manager, user):
+        super().__init__()
+        self.permission_cache = permission_cache
+        self.permission_class = permission_class
+        self.manager = manager
+        self.user = user
+        self.instances = {}
+
+    def load_instance(self, inst):
+        self.instances[inst.pk] = inst
+        return self.load(inst.pk)
+
+    def batch_load_fn(self, keys):
+        viewable = self.permission_cache.can_view_many(
+            self.permission_class,
+            self.manager,
+            self.user,
+            [self.instances[key] for key in keys],
+        )
+        return Promise.resolve([key in viewable for key in keys])
+
+
+def forget_instance(context, model, pk):
+    """ Clears what the loaders of the request `context` have cached for the `model`
+    instance with the given primary key. """
+    for loader in getattr(context, LOADERS_ATTR, {}).values():
+        if isinstance(loader, VisibilityLoader) and loader.manager.model is model:
+            loader.instances.pop(pk, None)
+            loader.clear(pk)
+        elif isinstance(loader, InstanceLoader) and loader.model is model:
+            if loader.field_name == model._meta.pk.name:
+                loader.clear(pk)
+            else:
+                # Keyed by another field, whose value the instance may have changed
+                loader.clear_all()
+
+
+class ConnectionPageLoader(DataLoader):
+
+    """ Loads a page of a nested connection for each parent instance. `load_pages` is
+    called with the keys of every parent requested at one level of the query, and must
+    return a dict mapping each of those keys to its page. """
+
+    def __init__(self, load_pages):
+        super().__init__()
+        self.load_pages = load_pages
+
+    def batch_load_fn(self, keys):
+        pages = self.load_pages(keys)
+        return Promise.resolve([pages[key] for key in keys])
@@ -1,6 +1,11 @@
+import re
+
 import graphene
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import IntegrityError, connections, router, transaction
 from graphql.error import GraphQLError
 from graphene.relay.mutation import ClientIDMutation
+from rest_framework.serializers import ModelSerializer
 from graphene_django.rest_framework.mutation import (
     ErrorType,
     Field,
@@ -11,15 +16,67 @@ from graphene_django.rest_framework.mutation import (
     yank_fields_from_attrs,
 )
 
-from .connections import OrderByField, get_paginator_for_queryset
+from .connections import OrderByField, encode_cursor
 from .node import PermissionedNode
-from .utils import get_fields
+from .optimizer import get_select_related_paths, optimize_queryset
+from .permissions import SimplePermission, get_permission_cache, invalidate_instance
+from .selections import combine_selections, get_fields
 
 EDGE_ORDER_BY_INPUT_FIELD = "edge_cursor_order_by"
+PERMISSION_ERROR_MESSAGE = "You do not have permission to perform this mutation"
+BULK_INTEGRITY_ERROR_MESSAGE = (
+    "The batch could not be saved, as it conflicts with existing data. No items were saved."
+)
+
+
+# Set in the serializer context once the user's permission to change the instance
+# has been checked while looking it up.
+PERMISSION_CHECKED_CONTEXT_KEY = "permission_checked"
 
 
 def _raise_permission_error():
-    raise GraphQLError("You do not have permission to perform this mutation")
+    raise GraphQLError(PERMISSION_ERROR_MESSAGE)
+
+
+def get_serializer_relations(serializer, model_meta):
+    """ Returns the names of the foreign keys and many to many fields on the model (whose
+    `_meta` is `model_meta`) which `serializer` writes, so that they can be loaded
+    alongside the instance. """
+    select_related = []
+    prefetch_related = []
+    for field in serializer.fields.values():
+        if field.read_only or "." in field.source:
+            continue
+        try:
+            model_field = model_meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if model_field.many_to_many:
+            prefetch_related.append(model_field.name)
+        elif model_field.concrete and model_field.is_relation:
+            select_related.append(model_field.name)
+    return select_related, prefetch_related
+
+
+def get_permissioned_instance(queryset, permitted_qs, id_val, select_for_update=False):
+    """ Fetches the instance in `queryset` with the primary key `id_val`, provided that it
+    is in the `permitted_qs` (e.g. the user's `get_changeable` queryset), with a single
+    query. Raises an error if the instance does not exist or is not permitted. """
+    model_class = queryset.model
+    qs = queryset.filter(pk__in=permitted_qs.filter(pk=id_val).values("pk"))
+    if select_for_update:
+        features = connections[router.db_for_write(model_class)].features
+        if qs.query.select_related and features.has_select_for_update_of:
+            # Only the instance itself needs to be locked
+            qs = qs.select_for_update(of=("self",))
+        else:
+            qs = qs.select_related(None).select_for_update()
+    instance = qs.first()
+    if instance is None:
+        if model_class.objects.filter(pk=id_val).exists():
+            _raise_permission_error()
+        raise Exception(f"{model_class} instance with ID {id_val} does not exist.")
+    return instance
 
 
 class PermissionedSerializerMutation(ClientIDMutation):
@@ -30,6 +87,11 @@ class PermissionedSerializerMutation(ClientIDMutation):
     while `output_type` is used to "serialize" the resulting object if it is successfully created.
     `permission_class` is used to determine with a given user is permitted to perform a particular 
     mutation. 
+
+    If `permissioned_lookup` is set, instances which are being updated are fetched from the
+    user's `get_changeable` queryset, so the permission check and lookup happen in one query
+    (`can_change` is not called). Setting `select_for_update` also locks the instance until the
+    mutation completes. The relations written by the serializer are loaded alongside the instance.
     
     Note: This base class is heavily based on the SeralizerMutation class in the graphene_django package. 
     Unfortunately, that class did not allow you to use an existing DjangoObjectType as output,
@@ -56,6 +118,8 @@ class PermissionedSerializerMutation(ClientIDMutation):
         model_operations=["create", "update"],
         only_fields=(),
         exclude_fields=(),
+        permissioned_lookup=False,
+        select_for_update=False,
         **options,
     ):
         assert (
@@ -69,6 +133,8 @@ class PermissionedSerializerMutation(ClientIDMutation):
         cls.permission_class = permission_class
         cls.output_type = output_type
         cls.edge_output_type = edge_output_type
+        cls.permissioned_lookup = permissioned_lookup
+        cls.select_for_update = select_for_update
 
         if not serializer_class:
             raise Exception("serializer_class is required for the SerializerMutation")
@@ -82,6 +148,13 @@ class PermissionedSerializerMutation(ClientIDMutation):
             if serializer_meta:
                 model_class = getattr(serializer_meta, "model", None)
 
+        cls.serializer_relations = ([], [])
+        if permissioned_lookup and model_class:
+            # Building the serializer's fields is expensive, so this is only done once
+            cls.serializer_relations = get_serializer_relations(
+                serializer, model_class._meta
+            )
+
         if lookup_field is None and model_class:
             lookup_field = model_class._meta.pk.name
 
@@ -123,7 +196,20 @@ class PermissionedSerializerMutation(ClientIDMutation):
         model_class = cls._meta.model_class
 
         if model_class:
-            if "update" in cls._meta.model_operations and lookup_field in input:
+            if (
+                "update" in cls._meta.model_operations
+                and lookup_field in input
+                and cls.permissioned_lookup
+            ):
+                return {
+                    "instance": cls.get_permissioned_instance(info, input[lookup_field]),
+                    "data": input,
+                    "context": {
+                        "request": info.context,
+                        PERMISSION_CHECKED_CONTEXT_KEY: True,
+                    },
+                }
+            elif "update" in cls._meta.model_operations and lookup_field in input:
                 id_val = input[lookup_field]
                 instance = model_class.objects.filter(id=id_val).first()
                 if not instance:
@@ -147,6 +233,25 @@ class PermissionedSerializerMutation(ClientIDMutation):
 
         return {"data": input, "context": {"request": info.context}}
 
+    @classmethod
+    def get_permissioned_instance(cls, info, id_val):
+        model_class = cls._meta.model_class
+        perm_inst = get_permission_cache(info.context).get_permission(
+            cls.permission_class, model_class.objects
+        )
+        select_related, prefetch_related = cls.serializer_relations
+        queryset = model_class.objects.all()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return get_permissioned_instance(
+            queryset,
+            perm_inst.get_changeable(info.context.user),
+            id_val,
+            select_for_update=cls.select_for_update,
+        )
+
     @classmethod
     def mutate_and_get_payload(cls, root, info, **input):
         requested_fields = get_fields(info)
@@ -154,6 +259,14 @@ class PermissionedSerializerMutation(ClientIDMutation):
             raise Exception(
                 "You cannot request the `edge` field without also specifying an ordering value using `edgeCursorOrderBy` in the mutation input. Otherwise, the mutation handler does not know how to compute the cursor for the resulting edge."
             )
+        if cls.select_for_update:
+            # Locks are held until the transaction ends
+            with transaction.atomic(using=router.db_for_write(cls._meta.model_class)):
+                return cls.validate_and_perform_mutate(root, info, **input)
+        return cls.validate_and_perform_mutate(root, info, **input)
+
+    @classmethod
+    def validate_and_perform_mutate(cls, root, info, **input):
         kwargs = cls.get_serializer_kwargs(root, info, **input)
         serializer = cls._meta.serializer_class(**kwargs)
 
@@ -169,16 +282,32 @@ class PermissionedSerializerMutation(ClientIDMutation):
 
     @classmethod
     def _get_edge(cls, obj, ordering):
-        paginator = get_paginator_for_queryset(
-            cls._meta.model_class.objects.all(), ordering=ordering
-        )
-        cursor = paginator.cursor(obj)
+        cursor = encode_cursor(obj, ordering)
         edge = cls.edge_output_type(node=obj, cursor=cursor)
         return edge
 
     @classmethod
-    def _save_and_get_payload(cls, serializer, **input):
-        obj = serializer.save()
+    def get_result_instance(cls, obj, info, ordering=None):
+        """ Re-reads the saved `obj` if the payload requests related instances, so that they
+        are loaded with a single query rather than resolved one by one. """
+        requested_fields = get_fields(info)
+        selection = combine_selections(
+            requested_fields.get("result", {}),
+            requested_fields.get("edge", {}).get("node", {}),
+        )
+        if not get_select_related_paths(cls.output_type, selection):
+            return obj
+        qs = cls._meta.model_class.objects.filter(pk=obj.pk)
+        if ordering:
+            # Makes sure the fields needed for the edge cursor are loaded
+            qs = qs.order_by(*ordering)
+        return optimize_queryset(qs, cls.output_type, selection).first() or obj
+
+    @classmethod
+    def _save_and_get_payload(cls, serializer, info, **input):
+        obj = cls.get_result_instance(
+            serializer.save(), info, input.get(EDGE_ORDER_BY_INPUT_FIELD)
+        )
         # Value for EDGE_ORDER_BY_INPUT_FIELD is required if
         # edge is a requested field, but otherwise it is optional.
         # Validation for this happens in `mutate_and_get_payload`
@@ -192,10 +321,14 @@ class PermissionedSerializerMutation(ClientIDMutation):
     @classmethod
     def perform_mutate(cls, serializer, info, **input):
         obj = serializer.instance or serializer.build_obj()
-        perm_inst = cls.permission_class()
-        perm_inst.queryset = obj.__class__.objects.all()
+        perm_inst = get_permission_cache(info.context).get_permission(
+            cls.permission_class, obj.__class__.objects
+        )
         has_permission = False
-        if obj.id:
+        if obj.id and serializer.context.get(PERMISSION_CHECKED_CONTEXT_KEY):
+            # Fetched from the user's changeable instances
+            has_permission = True
+        elif obj.id:
             # This is an update
             has_permission = perm_inst.can_change(info.context.user, obj)
         else:
@@ -204,7 +337,372 @@ class PermissionedSerializerMutation(ClientIDMutation):
         if not has_permission:
             _raise_permission_error()
 
-        return cls._save_and_get_payload(serializer, **input)
+        payload = cls._save_and_get_payload(serializer, info, **input)
+        if obj.id:
+            # Changes may affect who can view the instance
+            invalidate_instance(info.context, type(obj), obj.pk)
+        return payload
+
+
+class BulkErrorType(graphene.ObjectType):
+    index = graphene.Int(
+        required=True, description="Position of the input item the error relates to."
+    )
+    field = graphene.String()
+    messages = graphene.List(graphene.NonNull(graphene.String), required=True)
+
+
+class PermissionedBulkSerializerMutation(ClientIDMutation):
+
+    """
+    Creates and / or updates many instances with a single mutation. Takes a list of `items`,
+    each of which has the same fields as the input of the equivalent `PermissionedSerializerMutation`.
+    Items with an `id` update the existing instance, while the rest are created.
+
+    Every item is validated and permission checked before anything is written. If any item
+    fails, nothing is written and `errors` contains the problems with each item (identified by
+    its `index`). Otherwise, every instance is written in a single transaction, using `bulk_create`
+    and `bulk_update` where possible. Note that these do not call `save()` or send model signals.
+    If the serializer has its own `create` or `update` method, or many to many fields, each
+    instance is saved with the serializer instead.
+    """
+
+    class Meta:
+        abstract = True
+
+    errors = graphene.List(
+        BulkErrorType, description="May contain more than one error for the same item."
+    )
+    ok = graphene.Boolean(required=True)
+
+    @classmethod
+    def __init_subclass_with_meta__(
+        cls,
+        permission_class=None,
+        output_type=None,
+        serializer_class=None,
+        model_class=None,
+        model_operations=["create", "update"],
+        only_fields=(),
+        exclude_fields=(),
+        batch_size=None,
+        **options,
+    ):
+        assert (
+            permission_class
+        ), "A permission class is required when using PermissionedBulkSerializerMutation."
+
+        assert (
+            output_type
+        ), "An output type is required when using PermissionedBulkSerializerMutation."
+
+        cls.permission_class = permission_class
+        cls.output_type = output_type
+        cls.batch_size = batch_size
+
+        if not serializer_class:
+            raise Exception("serializer_class is required for the SerializerMutation")
+
+        if "update" not in model_operations and "create" not in model_operations:
+            raise Exception('model_operations must contain "create" and/or "update"')
+
+        if model_class is None:
+            model_class = serializer_class.Meta.model
+
+        serializer = serializer_class()
+        item_fields = yank_fields_from_attrs(
+            fields_for_serializer(serializer, only_fields, exclude_fields, is_input=True),
+            _as=InputField,
+        )
+        if "update" in model_operations:
+            item_fields["id"] = graphene.GlobalID(required=False)
+        else:
+            item_fields.pop("id", None)
+
+        base_name = re.sub("Payload$", "", options.get("name") or cls.__name__)
+        item_input = type(f"{base_name}Item", (graphene.InputObjectType,), item_fields)
+
+        _meta = SerializerMutationOptions(cls)
+        _meta.lookup_field = model_class._meta.pk.name
+        _meta.model_operations = model_operations
+        _meta.serializer_class = serializer_class
+        _meta.model_class = model_class
+        # Results are returned in the same order as the input items
+        _meta.fields = {"results": graphene.Field(graphene.List(output_type))}
+
+        input_fields = {
+            "items": graphene.List(graphene.NonNull(item_input), required=True)
+        }
+
+        super(PermissionedBulkSerializerMutation, cls).__init_subclass_with_meta__(
+            _meta=_meta, input_fields=input_fields, **options
+        )
+
+    @classmethod
+    def get_instances(cls, items):
+        """ Loads the instances which are being updated with a single query. """
+        pk_field = cls._meta.model_class._meta.pk
+        ids = []
+        for item in items:
+            if item.get("id"):
+                try:
+                    ids.append(pk_field.to_python(item["id"]))
+                except ValidationError:
+                    # Reported as an error of the item
+                    continue
+        if not ids:
+            return {}
+        if "update" not in cls._meta.model_operations:
+            raise Exception("Instances can not be updated using this mutation.")
+        return cls._meta.model_class.objects.in_bulk(ids)
+
+    @classmethod
+    def can_bulk_write(cls, validated_data):
+        """ Whether instances can be written with `bulk_create` and `bulk_update`, rather
+        than by calling `save()` on the serializer. """
+        serializer_class = cls._meta.serializer_class
+        if (
+            serializer_class.create is not ModelSerializer.create
+            or serializer_class.update is not ModelSerializer.update
+        ):
+            return False
+        model_meta = cls._meta.model_class._meta
+        for data in validated_data:
+            for name in data:
+                try:
+                    field = model_meta.get_field(name)
+                except FieldDoesNotExist:
+                    return False
+                if not field.concrete or field.many_to_many:
+                    return False
+        return True
+
+    @classmethod
+    def mutate_and_get_payload(cls, root, info, items, **input):
+        model_class = cls._meta.model_class
+        serializer_class = cls._meta.serializer_class
+        user = info.context.user
+        serializer_context = {"request": info.context}
+        instances = cls.get_instances(items)
+        pk_field = model_class._meta.pk
+
+        errors = []
+        created_indexes = []
+        created_data = []
+        updates = []
+        for index, item in enumerate(items):
+            data = dict(item)
+            id_val = data.pop("id", None)
+            if not id_val:
+                if "create" not in cls._meta.model_operations:
+                    errors.append(
+                        BulkErrorType(
+                            index=index, field="id", messages=["This field is required."]
+                        )
+                    )
+                    continue
+                created_indexes.append(index)
+                created_data.append(data)
+                continue
+            try:
+                pk = pk_field.to_python(id_val)
+            except ValidationError as e:
+                errors.append(BulkErrorType(index=index, field="id", messages=e.messages))
+                continue
+            instance = instances.get(pk)
+            if instance is None:
+                errors.append(
+                    BulkErrorType(
+                        index=index,
+                        field="id",
+                        messages=[f"{model_class} instance with ID {id_val} does not exist."],
+                    )
+                )
+                continue
+            # List serializers validate every item against the same instance, so items
+            # which update an instance each get their own serializer.
+            updates.append(
+                (
+                    index,
+                    serializer_class(instance, data=data, context=serializer_context),
+                )
+            )
+
+        create_serializer = serializer_class(
+            data=created_data, many=True, context=serializer_context
+        )
+        if created_data and not create_serializer.is_valid():
+            for index, item_errors in zip(created_indexes, create_serializer.errors):
+                errors.extend(
+                    BulkErrorType(index=index, field=key, messages=value)
+                    for key, value in item_errors.items()
+                )
+        for index, serializer in updates:
+            if not serializer.is_valid():
+                errors.extend(
+                    BulkErrorType(index=index, field=key, messages=value)
+                    for key, value in serializer.errors.items()
+                )
+        if not errors:
+            errors = cls.get_duplicate_errors(
+                list(zip(created_indexes, create_serializer.validated_data))
+                if created_data
+                else [],
+                updates,
+            )
+        if errors:
+            return cls(errors=errors, ok=False)
+
+        # Permissions are checked for every item at once
+        permission_cache = get_permission_cache(info.context)
+        perm_inst = permission_cache.get_permission(
+            cls.permission_class, model_class.objects
+        )
+        validated_data = list(create_serializer.validated_data) if created_data else []
+        objs = [cls.build_instance(data) for data in validated_data]
+        for index, can_add in zip(
+            created_indexes, perm_inst.can_add_many(user, objs)
+        ):
+            if not can_add:
+                errors.append(
+                    BulkErrorType(index=index, messages=[PERMISSION_ERROR_MESSAGE])
+                )
+        changeable = perm_inst.can_change_many(
+            user, [serializer.instance for _, serializer in updates]
+        )
+        for index, serializer in updates:
+            if serializer.instance.pk not in changeable:
+                errors.append(
+                    BulkErrorType(index=index, messages=[PERMISSION_ERROR_MESSAGE])
+                )
+        if errors:
+            return cls(errors=sorted(errors, key=lambda error: error.index), ok=False)
+
+        results = [None] * len(items)
+        update_data = [serializer.validated_data for _, serializer in updates]
+        try:
+            with transaction.atomic(using=router.db_for_write(model_class)):
+                if cls.can_bulk_write(validated_data + update_data):
+                    objs = cls.bulk_create(objs)
+                    updated = cls.bulk_update(
+                        [serializer.instance for _, serializer in updates], update_data
+                    )
+                else:
+                    objs = create_serializer.save() if created_data else []
+                    updated = [serializer.save() for _, serializer in updates]
+        except IntegrityError:
+            # Conflicts which validation can not detect, e.g. with rows written by a
+            # concurrent request. Nothing was written.
+            return cls(
+                errors=[
+                    BulkErrorType(index=index, messages=[BULK_INTEGRITY_ERROR_MESSAGE])
+                    for index in sorted(created_indexes + [i for i, _ in updates])
+                ],
+                ok=False,
+            )
+        for index, obj in zip(created_indexes, objs):
+            results[index] = obj
+        for (index, _), obj in zip(updates, updated):
+            results[index] = obj
+            # Changes may affect who can view the instance
+            invalidate_instance(info.context, model_class, obj.pk)
+        return cls(errors=None, results=results, ok=True)
+
+    @classmethod
+    def get_duplicate_errors(cls, created, updates):
+        """ Returns errors for items which would give the same value to a unique field (or
+        unique set of fields) as an earlier item in the batch. Validation only compares
+        items with the database, so these would otherwise fail when written. `created`
+        holds the index and validated data of each new item, `updates` the index and
+        serializer of each update. """
+        model_meta = cls._meta.model_class._meta
+        unique_sets = [
+            (field.name,)
+            for field in model_meta.concrete_fields
+            if field.unique and not field.primary_key
+        ] + [tuple(names) for names in model_meta.unique_together]
+        items = [(index, data, None) for index, data in created] + [
+            (index, serializer.validated_data, serializer.instance)
+            for index, serializer in updates
+        ]
+        items.sort(key=lambda item: item[0])
+
+        errors = []
+        for names in unique_sets:
+            seen = set()
+            for index, data, instance in items:
+                values = tuple(
+                    data[name] if name in data else getattr(instance, name, None)
+                    for name in names
+                )
+                if any(value is None for value in values):
+                    continue
+                if values in seen:
+                    if len(names) == 1:
+                        errors.append(
+                            BulkErrorType(
+                                index=index,
+                                field=names[0],
+                                messages=["This field must be unique within the batch."],
+                            )
+                        )
+                    else:
+                        errors.append(
+                            BulkErrorType(
+                                index=index,
+                                messages=[
+                                    "The fields {} must make a unique set within the "
+                                    "batch.".format(", ".join(names))
+                                ],
+                            )
+                        )
+                seen.add(values)
+        return sorted(errors, key=lambda error: error.index)
+
+    @classmethod
+    def build_instance(cls, data):
+        """ Builds an unsaved instance from validated data, ignoring values (such as many to
+        many relations) which can not be set when the instance is constructed. """
+        model_meta = cls._meta.model_class._meta
+        values = {}
+        for name, value in data.items():
+            try:
+                field = model_meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                values[name] = value
+        return cls._meta.model_class(**values)
+
+    @classmethod
+    def bulk_create(cls, objs):
+        model_class = cls._meta.model_class
+        features = connections[router.db_for_write(model_class)].features
+        can_return_pks = getattr(
+            features,
+            "can_return_rows_from_bulk_insert",
+            getattr(features, "can_return_ids_from_bulk_insert", False),
+        )
+        if not can_return_pks:
+            # The primary keys of the new instances are needed for the results
+            for obj in objs:
+                obj.save(force_insert=True)
+            return objs
+        return model_class.objects.bulk_create(objs, batch_size=cls.batch_size)
+
+    @classmethod
+    def bulk_update(cls, instances, update_data):
+        fields = []
+        for instance, data in zip(instances, update_data):
+            for name, value in data.items():
+                setattr(instance, name, value)
+                if name not in fields:
+                    fields.append(name)
+        if instances and fields:
+            cls._meta.model_class.objects.bulk_update(
+                instances, fields, batch_size=cls.batch_size
+            )
+        return instances
 
 
 class DeletionInput(graphene.InputObjectType):
@@ -212,14 +710,28 @@ class DeletionInput(graphene.InputObjectType):
 
 
 class PermissionedDeletionMutation(graphene.Mutation):
+
+    """ Deletes a single instance. If `permissioned_lookup` is set, the instance is fetched
+    from the user's `get_deletable` queryset rather than checked with `can_delete`, and
+    `select_for_update` also locks it until it has been deleted. """
+
     @classmethod
-    def __init_subclass_with_meta__(cls, permission_class=None, model=None, **options):
+    def __init_subclass_with_meta__(
+        cls,
+        permission_class=None,
+        model=None,
+        permissioned_lookup=False,
+        select_for_update=False,
+        **options,
+    ):
         assert (
             permission_class
         ), "A permission class is required when using PermissionedDeletionMutation."
         assert model, "A model is required when using PermissionedDeletionMutation"
         cls.permission_class = permission_class
         cls.model = model
+        cls.permissioned_lookup = permissioned_lookup
+        cls.select_for_update = select_for_update
         super().__init_subclass_with_meta__(**options)
 
     class Meta:
@@ -232,17 +744,123 @@ class PermissionedDeletionMutation(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, input):
+        if cls.select_for_update:
+            # Locks are held until the transaction ends
+            with transaction.atomic(using=router.db_for_write(cls.model)):
+                return cls.perform_delete(info, input)
+        return cls.perform_delete(info, input)
+
+    @classmethod
+    def perform_delete(cls, info, input):
         ok = True
         model_class = cls.model
-        obj = model_class.objects.filter(id=input.id).first()
-        if not obj:
-            raise Exception(
-                f"{model_class} instance with ID {input.id} does not exist."
+        permission_cache = get_permission_cache(info.context)
+        perm_inst = permission_cache.get_permission(
+            cls.permission_class, model_class.objects
+        )
+        if cls.permissioned_lookup:
+            obj = get_permissioned_instance(
+                model_class.objects.all(),
+                perm_inst.get_deletable(info.context.user),
+                input.id,
+                select_for_update=cls.select_for_update,
             )
-        perm_inst = cls.permission_class()
-        perm_inst.queryset = model_class.objects.all()
-        can_delete = perm_inst.can_delete(info.context.user, obj)
-        if not can_delete:
-            _raise_permission_error()
+        else:
+            obj = model_class.objects.filter(id=input.id).first()
+            if not obj:
+                raise Exception(
+                    f"{model_class} instance with ID {input.id} does not exist."
+                )
+            can_delete = perm_inst.can_delete(info.context.user, obj)
+            if not can_delete:
+                _raise_permission_error()
+        invalidate_instance(info.context, model_class, obj.pk)
         obj.delete()
         return cls(ok=ok)
+
+
+class BulkDeletionInput(graphene.InputObjectType):
+    ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+
+
+class PermissionedBulkDeletionMutation(graphene.Mutation):
+
+    """
+    Deletes every instance in a list of ids which the user is permitted to delete. Ids which do
+    not exist or which the user can not delete are returned in `missing_ids` and `denied_ids`.
+
+    Unless the permission class overrides `can_delete`, the ids are intersected with the
+    user's `get_deletable` queryset by the database, and the matching instances are deleted
+    in the same transaction using that queryset, so permissions can not change between
+    being checked and acted on. Django deletes them with a single statement when no signal
+    receivers or cascades apply to the model.
+    """
+
+    @classmethod
+    def __init_subclass_with_meta__(cls, permission_class=None, model=None, **options):
+        assert (
+            permission_class
+        ), "A permission class is required when using PermissionedBulkDeletionMutation."
+        assert model, "A model is required when using PermissionedBulkDeletionMutation"
+        cls.permission_class = permission_class
+        cls.model = model
+        super().__init_subclass_with_meta__(**options)
+
+    class Meta:
+        abstract = True
+
+    class Arguments:
+        input = BulkDeletionInput(required=True)
+
+    ok = graphene.Boolean(
+        required=True, description="Whether every requested instance was deleted."
+    )
+    deleted_ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+    denied_ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+    missing_ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+
+    @classmethod
+    def mutate(cls, root, info, input):
+        model_class = cls.model
+        user = info.context.user
+        ids = list(dict.fromkeys(input.ids))
+        permission_cache = get_permission_cache(info.context)
+        perm_inst = permission_cache.get_permission(
+            cls.permission_class, model_class.objects
+        )
+        requested = model_class.objects.filter(pk__in=ids)
+
+        with transaction.atomic(using=router.db_for_write(model_class)):
+            if cls.permission_class.can_delete is SimplePermission.can_delete:
+                deletable = model_class.objects.filter(
+                    pk__in=perm_inst.get_deletable(user).filter(pk__in=ids).values("pk")
+                )
+                # Locked, so that they are the instances which are deleted below
+                deletable_ids = set(
+                    deletable.select_for_update().values_list("pk", flat=True)
+                )
+            else:
+                # Only the fields needed to check permissions are loaded
+                instances = requested.select_for_update().only(
+                    model_class._meta.pk.name,
+                    *getattr(cls.permission_class, "required_fields", ()),
+                )
+                deletable_ids = perm_inst.can_delete_many(user, instances)
+                deletable = model_class.objects.filter(pk__in=deletable_ids)
+            if deletable_ids:
+                deletable.delete()
+
+        deleted_ids = [pk for pk in ids if pk in deletable_ids]
+        for pk in deleted_ids:
+            invalidate_instance(info.context, model_class, pk)
+        found_ids = set(deleted_ids)
+        if len(deleted_ids) < len(ids):
+            found_ids |= set(requested.values_list("pk", flat=True))
+        denied_ids = [pk for pk in ids if pk in found_ids and pk not in deletable_ids]
+        missing_ids = [pk for pk in ids if pk not in found_ids]
+        return cls(
+            ok=not (denied_ids or missing_ids),
+            deleted_ids=deleted_ids,
+            denied_ids=denied_ids,
+            missing_ids=missing_ids,
+        )
@@ -24,7 +24,7 @@ class PermissionedNode(Node):
         if cls not in only_type._meta.interfaces:
             return None
 
-        node = only_type.get_node(info, global_id)
+        node = only_type.get_node_promise(info, global_id)
 
         return node
 
@@ -0,0 +1,157 @@
+from functools import lru_cache
+
+from django.db import models
+from graphene.utils.str_converters import to_camel_case
+
+"""
+Functions which use the selection set of an incoming query to reduce the number
+of database queries needed to resolve it. Selections are expected in the format
+returned by `selections.get_fields`.
+"""
+
+
+@lru_cache(maxsize=None)
+def get_model_relations(model):
+    """ Maps the names graphene-django gives to the relational fields of `model` onto
+    the fields themselves. Reverse relations are named using their accessor name (e.g.
+    `group_set`), which is also the name graphene-django uses for them. """
+    relations = {}
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            name = field.get_accessor_name()
+        else:
+            name = field.name
+        if name:
+            relations[name] = field
+    return relations
+
+
+@lru_cache(maxsize=None)
+def get_graphql_field_names(type_):
+    """ Maps the (camel cased) names used in queries for the fields on `type_` onto
+    the names of the fields on the graphene type. """
+    return {
+        getattr(field, "name", None) or to_camel_case(name): name
+        for name, field in type_._meta.fields.items()
+    }
+
+
+def get_selected_fields(type_, selection):
+    """ Yields the graphene field name and sub-selection for each field in `selection`
+    which exists on `type_`. """
+    graphql_field_names = get_graphql_field_names(type_)
+    for graphql_name, sub_selection in selection.items():
+        name = graphql_field_names.get(graphql_name)
+        if name:
+            yield name, sub_selection
+
+
+def get_node_selection(connection_selection):
+    """ Returns the selection made on the nodes of a connection. """
+    return connection_selection.get("edges", {}).get("node", {})
+
+
+def get_select_related_paths(type_, selection, prefix=""):
+    """ Returns the `select_related` paths needed to load every foreign key and one to one
+    relation in `selection` (including nested ones) alongside instances of `type_`. """
+    paths = []
+    relations = get_model_relations(type_._meta.model)
+    for name, sub_selection in get_selected_fields(type_, selection):
+        relation = relations.get(name)
+        if not isinstance(relation, (models.ForeignKey, models.OneToOneRel)):
+            continue
+        related_type = type_._meta.registry.get_type_for_model(relation.related_model)
+        if not related_type:
+            continue
+        if isinstance(relation, models.OneToOneRel):
+            # Reverse one to one relations are traversed using their query name
+            path = prefix + relation.field.related_query_name()
+        else:
+            path = prefix + relation.name
+        paths.extend(
+            get_select_related_paths(related_type, sub_selection, path + "__")
+            or [path]
+        )
+    return paths
+
+
+def get_only_fields(type_, selection, prefix=""):
+    """ Returns the names of the columns needed to resolve `selection` on `type_` (plus those
+    needed by related instances loaded with `get_select_related_paths`), for use with `only()`.
+    The primary key and any `required_fields` declared by the type's permission class are
+    always included. Returns `None` if a selected field is not backed by a model field or has
+    a custom resolver, as there is no way to know which columns it uses. """
+    model = type_._meta.model
+    concrete_field_names = {field.name for field in model._meta.concrete_fields}
+    relations = get_model_relations(model)
+    permission_class = getattr(type_, "permission_class", None)
+    fields = [prefix + model._meta.pk.name]
+    fields.extend(
+        prefix + name for name in getattr(permission_class, "required_fields", ())
+    )
+    for name, sub_selection in get_selected_fields(type_, selection):
+        if name == "id":
+            continue
+        if hasattr(type_, f"resolve_{name}"):
+            return None
+        relation = relations.get(name)
+        if isinstance(relation, (models.ForeignKey, models.OneToOneRel)):
+            if isinstance(relation, models.OneToOneRel):
+                lookup = relation.field.related_query_name()
+                related_prefix = prefix + lookup + "__"
+                fields.append(related_prefix + relation.field.name)
+            else:
+                lookup = relation.name
+                related_prefix = prefix + lookup + "__"
+                fields.append(prefix + lookup)
+            related_type = type_._meta.registry.get_type_for_model(
+                relation.related_model
+            )
+            if not related_type:
+                continue
+            related_fields = get_only_fields(related_type, sub_selection, related_prefix)
+            if related_fields is None:
+                related_fields = [
+                    related_prefix + field.name
+                    for field in relation.related_model._meta.concrete_fields
+                ]
+            fields.extend(related_fields)
+        elif relation is not None:
+            # Many to many and reverse relations are loaded using the primary key
+            continue
+        elif name in concrete_field_names:
+            fields.append(prefix + name)
+        else:
+            return None
+    return fields
+
+
+def get_ordering_fields(qs):
+    """ Returns the names of the columns `qs` is ordered by, or `None` if the ordering
+    uses expressions. """
+    concrete_field_names = {field.name for field in qs.model._meta.concrete_fields}
+    fields = []
+    for order in qs.query.order_by:
+        if not isinstance(order, str):
+            return None
+        name = order.lstrip("-").split("__")[0]
+        if name == "pk" or name in concrete_field_names:
+            fields.append(name)
+    return fields
+
+
+def optimize_queryset(qs, type_, selection):
+    """ Applies `select_related` to `qs` so that related instances requested in `selection`
+    are loaded in the same query as the `type_` instances themselves, rather than with one
+    query per instance. Also uses `only()` to avoid loading columns which are not needed
+    to resolve `selection`, or to order and paginate `qs`. """
+    paths = get_select_related_paths(type_, selection)
+    if paths:
+        qs = qs.select_related(*paths)
+    only_fields = get_only_fields(type_, selection)
+    ordering_fields = get_ordering_fields(qs)
+    if only_fields is not None and ordering_fields is not None:
+        qs = qs.only(*only_fields, *ordering_fields)
+    return qs
@@ -1 +1,163 @@
-from ..api.simple_api.permissions import SimplePermission as Permission
+from ..api.simple_api.permissions import SimplePermission
+
+from .loaders import forget_instance
+
+
+class Permission(SimplePermission):
+
+    """ Adds bulk versions of the SimplePermission checks, so that the permissions for
+    many instances can be determined with a single query rather than one per instance. """
+
+    # Names of fields which permission checks read from instances. These fields are
+    # always loaded, even if they are not requested in a query.
+    required_fields = ()
+
+    def can_view_many(self, user, instances):
+        """ Returns the primary keys of the `instances` which `user` can view. Uses a single
+        `get_viewable` query, unless `can_view` has been overridden, in which case `can_view`
+        is called for each instance so that the two methods always agree. """
+        if type(self).can_view is not SimplePermission.can_view:
+            return {inst.pk for inst in instances if self.can_view(user, inst)}
+        pks = {inst.pk for inst in instances}
+        if not pks:
+            return set()
+        return set(
+            self.get_viewable(user).filter(pk__in=pks).values_list("pk", flat=True)
+        )
+
+    def can_add_many(self, user, objs):
+        """ Returns a list containing whether `user` can add each of the (unsaved) `objs`. """
+        return [self.can_add(user, obj) for obj in objs]
+
+    def can_change_many(self, user, instances):
+        """ Returns the primary keys of the `instances` which `user` can change. Works like
+        `can_view_many`, using `get_changeable` or `can_change`. """
+        if type(self).can_change is not SimplePermission.can_change:
+            return {inst.pk for inst in instances if self.can_change(user, inst)}
+        pks = {inst.pk for inst in instances}
+        if not pks:
+            return set()
+        return set(
+            self.get_changeable(user).filter(pk__in=pks).values_list("pk", flat=True)
+        )
+
+    def can_delete_many(self, user, instances):
+        """ Returns the primary keys of the `instances` which `user` can delete. Works like
+        `can_view_many`, using `get_deletable` or `can_delete`. """
+        if type(self).can_delete is not SimplePermission.can_delete:
+            return {inst.pk for inst in instances if self.can_delete(user, inst)}
+        pks = {inst.pk for inst in instances}
+        if not pks:
+            return set()
+        return set(
+            self.get_deletable(user).filter(pk__in=pks).values_list("pk", flat=True)
+        )
+
+
+PERMISSION_CACHE_ATTR = "_graphene_django_plus_permission_cache"
+
+
+def _get_user_key(user):
+    return getattr(user, "pk", None)
+
+
+class PermissionCache(object):
+
+    """ Stores permission instances, `get_viewable` querysets and view decisions for the
+    duration of a single request, so that they are not recomputed every time the same
+    type or instance appears in a query. `hits` and `misses` count how often cached
+    querysets and decisions were reused. """
+
+    # Called with each new permission instance, and returns the object to use in its
+    # place (see `instrumentation.TimedPermission`)
+    permission_wrapper = None
+
+    def __init__(self):
+        self.permissions = {}
+        self.viewable_querysets = {}
+        self.decisions = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_permission(self, permission_class, manager):
+        """ Returns an instance of `permission_class` whose queryset contains every
+        instance in `manager`. """
+        key = (permission_class, manager)
+        if key not in self.permissions:
+            permission = permission_class()
+            permission.queryset = manager.all()
+            if self.permission_wrapper is not None:
+                permission = self.permission_wrapper(permission)
+            self.permissions[key] = permission
+        return self.permissions[key]
+
+    def get_viewable(self, permission_class, manager, user):
+        key = (permission_class, manager, _get_user_key(user), "view")
+        if key in self.viewable_querysets:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.viewable_querysets[key] = self.get_permission(
+                permission_class, manager
+            ).get_viewable(user)
+        return self.viewable_querysets[key]
+
+    def can_view_many(self, permission_class, manager, user, instances):
+        """ Cached version of `Permission.can_view_many`. Only instances without a cached
+        decision are passed on to the permission class. """
+        user_key = _get_user_key(user)
+        viewable = set()
+        unknown = []
+        for inst in instances:
+            key = (permission_class, manager.model, user_key, "view", inst.pk)
+            if key in self.decisions:
+                self.hits += 1
+                if self.decisions[key]:
+                    viewable.add(inst.pk)
+            else:
+                self.misses += 1
+                unknown.append(inst)
+        if unknown:
+            newly_viewable = self.get_permission(
+                permission_class, manager
+            ).can_view_many(user, unknown)
+            for inst in unknown:
+                key = (permission_class, manager.model, user_key, "view", inst.pk)
+                self.decisions[key] = inst.pk in newly_viewable
+            viewable |= newly_viewable
+        return viewable
+
+    def can_view(self, permission_class, manager, user, inst):
+        return inst.pk in self.can_view_many(permission_class, manager, user, [inst])
+
+    def invalidate(self, model, pk):
+        """ Forgets decisions made for the `model` instance with the given primary key.
+        Should be called whenever an instance is changed or deleted (see
+        `invalidate_instance`). """
+        self.decisions = {
+            key: decision
+            for key, decision in self.decisions.items()
+            if key[1] is not model or key[-1] != pk
+        }
+
+
+def get_permission_cache(context):
+    """ Returns the permission cache for the request `context`, creating it if necessary. """
+    cache = getattr(context, PERMISSION_CACHE_ATTR, None)
+    if cache is None:
+        cache = PermissionCache()
+        setattr(context, PERMISSION_CACHE_ATTR, cache)
+    return cache
+
+
+def invalidate_instance(context, model, pk):
+    """ Forgets the view decisions and loaded instances of the request `context` for the
+    `model` instance with the given primary key, so that changes made to it (e.g. by a
+    mutation) are seen by the rest of the request. """
+    get_permission_cache(context).invalidate(model, pk)
+    forget_instance(context, model, pk)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.core.cache import caches
+from graphql.error import GraphQLError
+
+"""
+Support for persisted queries, using the protocol followed by Apollo's clients. Instead
+of the query text, clients send its sha256 hash in the `persistedQuery` extension:
+
+    {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "<hash>"}}}
+
+If the hash is unknown, a `PersistedQueryNotFound` error is returned and the client
+sends the request again, this time with both the hash and the query text, which
+registers the query for subsequent requests.
+"""
+
+PERSISTED_QUERY_VERSION = 1
+DEFAULT_MAX_SIZE = 10000
+
+
+class PersistedQueryNotFound(GraphQLError):
+    def __init__(self):
+        super().__init__("PersistedQueryNotFound")
+
+
+class PersistedQueryNotAllowed(GraphQLError):
+    def __init__(self):
+        super().__init__("PersistedQueryNotAllowed")
+
+
+def get_query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class PersistedQueryStore:
+
+    """ Base class for stores which map query hashes onto query text. """
+
+    def get(self, query_hash):
+        raise NotImplementedError()
+
+    def set(self, query_hash, query):
+        raise NotImplementedError()
+
+    def register(self, query):
+        """ Stores `query`, e.g. to add it to the whitelist. Returns its hash. """
+        query_hash = get_query_hash(query)
+        self.set(query_hash, query)
+        return query_hash
+
+
+class InMemoryPersistedQueryStore(PersistedQueryStore):
+
+    """ Keeps the `max_size` most recently used queries in memory. Each process has
+    its own copy, so queries have to be registered once per process. """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.queries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, query_hash):
+        with self.lock:
+            query = self.queries.get(query_hash)
+            if query is not None:
+                self.queries.move_to_end(query_hash)
+            return query
+
+    def set(self, query_hash, query):
+        with self.lock:
+            self.queries[query_hash] = query
+            self.queries.move_to_end(query_hash)
+            while len(self.queries) > self.max_size:
+                self.queries.popitem(last=False)
+
+
+class DjangoCachePersistedQueryStore(PersistedQueryStore):
+
+    """ Keeps queries in the Django cache named `cache_alias`, so that they are shared
+    between processes. """
+
+    def __init__(self, cache_alias="default", timeout=None, key_prefix="persisted_query"):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def get_cache_key(self, query_hash):
+        return "{}:{}".format(self.key_prefix, query_hash)
+
+    def get(self, query_hash):
+        return caches[self.cache_alias].get(self.get_cache_key(query_hash))
+
+    def set(self, query_hash, query):
+        caches[self.cache_alias].set(
+            self.get_cache_key(query_hash), query, self.timeout
+        )
+
+
+def get_persisted_query_hash(extensions):
+    """ Returns the hash sent in the `persistedQuery` extension, if any. `extensions` may
+    be a dict or (for GET requests) a JSON encoded string. """
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            return None
+    if not isinstance(extensions, dict):
+        return None
+    persisted_query = extensions.get("persistedQuery")
+    if not isinstance(persisted_query, dict):
+        return None
+    if persisted_query.get("version", PERSISTED_QUERY_VERSION) != PERSISTED_QUERY_VERSION:
+        raise GraphQLError("Unsupported persisted query version.")
+    return persisted_query.get("sha256Hash")
+
+
+def resolve_persisted_query(store, query, extensions, whitelist_only=False):
+    """ Returns the text of the query to execute. Raises a `GraphQLError` if the query
+    has not been persisted, or if `whitelist_only` is set and `query` is not already in
+    `store` (in which case the store acts as a whitelist and is never added to). """
+    query_hash = get_persisted_query_hash(extensions)
+    if query_hash is None:
+        if whitelist_only and query and store.get(get_query_hash(query)) is None:
+            raise PersistedQueryNotAllowed()
+        return query
+    if not query:
+        query = store.get(query_hash)
+        if query is None:
+            raise PersistedQueryNotFound()
+        return query
+    if get_query_hash(query) != query_hash:
+        raise GraphQLError("Provided sha256Hash does not match query.")
+    if store.get(query_hash) is None:
+        if whitelist_only:
+            raise PersistedQueryNotAllowed()
+        store.set(query_hash, query)
+    return query
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+from graphql.language import ast
+
+"""
+Extracts the fields selected in a query from its AST. Selection trees are cached for
+each field node, so documents which are parsed once and executed many times (see
+`backend.CachedDocumentBackend`) only have their selections extracted once.
+"""
+
+DEFAULT_MAX_SIZE = 1000
+
+EMPTY_SELECTION = MappingProxyType({})
+
+
+def merge_selections(target, selection_set, fragments):
+    """ Adds the fields in `selection_set` to the `target` dict, following fragment
+    spreads and inline fragments. Fields which are selected more than once have their
+    sub-selections merged. """
+    if selection_set is None:
+        return target
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            sub_selection = target.setdefault(selection.name.value, {})
+            merge_selections(sub_selection, selection.selection_set, fragments)
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                merge_selections(target, fragment.selection_set, fragments)
+        elif isinstance(selection, ast.InlineFragment):
+            merge_selections(target, selection.selection_set, fragments)
+    return target
+
+
+def freeze_selection(selection):
+    if not selection:
+        return EMPTY_SELECTION
+    return MappingProxyType(
+        {name: freeze_selection(sub_selection) for name, sub_selection in selection.items()}
+    )
+
+
+def combine_selections(*selections):
+    """ Merges several selection trees into one read-only tree. """
+    combined = {}
+    for selection in selections:
+        _merge_into(combined, selection)
+    return freeze_selection(combined)
+
+
+def _merge_into(target, selection):
+    for name, sub_selection in selection.items():
+        _merge_into(target.setdefault(name, {}), sub_selection)
+
+
+class SelectionCache:
+
+    """ Keeps the selection trees of the `max_size` most recently used field nodes.
+    Entries are keyed by the identity of the node, and keep a reference to it so that
+    its id can not be reused by another node while the entry exists. """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.selections = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_selection(self, field_ast, fragments):
+        key = id(field_ast)
+        with self.lock:
+            entry = self.selections.get(key)
+            if entry is not None and entry[0] is field_ast:
+                self.selections.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        selection = freeze_selection(
+            merge_selections({}, field_ast.selection_set, fragments)
+        )
+        with self.lock:
+            self.selections[key] = (field_ast, selection)
+            self.selections.move_to_end(key)
+            while len(self.selections) > self.max_size:
+                self.selections.popitem(last=False)
+        return selection
+
+
+selection_cache = SelectionCache()
+
+
+def get_fields(info):
+    """ Returns the fields selected on the field being resolved, as a read-only mapping
+    of each field name onto its own selection, e.g.
+        {'name': {},
+         'sentimentsPerLanguage': {'id': {},
+                                   'name': {},
+                                   'totalSentiments': {}},
+         'slug': {}}
+    """
+    return selection_cache.get_selection(info.field_asts[0], info.fragments)
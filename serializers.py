@@ -1,8 +1,15 @@
-from rest_framework.serializers import IntegerField, ListField, PrimaryKeyRelatedField
+from django.core.exceptions import ValidationError
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import (
+    IntegerField,
+    ListField,
+    ListSerializer,
+    PrimaryKeyRelatedField,
+)
 from graphene_django.converter import convert_django_field
 from graphene_django.rest_framework.serializer_converter import get_graphene_type_from_serializer_field
 
-from ..api.simple_api.serializers import ModelSerializer as ModelMutationSerializer
+from ..api.simple_api.serializers import ModelSerializer as BaseModelMutationSerializer
 
 from .types import DjangoFileType
 
@@ -17,8 +24,149 @@ from graphene_file_upload.scalars import Upload
 
 
 class ManyToManyIDField(ListField):
+
+    """ A list of primary keys. If a `queryset` is given, every ID is checked to exist
+    in it using a single query. """
+
     child = IntegerField()
 
+    default_error_messages = {
+        "does_not_exist": 'Invalid pk "{pk_value}" - object does not exist.'
+    }
+
+    def __init__(self, *args, queryset=None, **kwargs):
+        self.queryset = queryset
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        if self.queryset is not None and ids:
+            found = set(
+                self.queryset.all().filter(pk__in=ids).values_list("pk", flat=True)
+            )
+            for id_val in ids:
+                if id_val not in found:
+                    self.fail("does_not_exist", pk_value=id_val)
+        return ids
+
+
+class BatchedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+
+    """ A `PrimaryKeyRelatedField` which takes instances from those loaded by its serializer
+    (see `BatchedRelatedFieldsMixin`) rather than querying for each primary key. """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Maps primary keys onto instances, once loaded
+        self.batch = None
+
+    def to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def to_internal_value(self, data):
+        if self.batch is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, ValueError, ValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in self.batch:
+            self.fail("does_not_exist", pk_value=data)
+        return self.batch[pk]
+
+
+class BatchedListSerializer(ListSerializer):
+
+    """ Loads the related instances of every item before validating them. """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.load_related_instances(data)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child.related_instances_loaded = False
+
+
+class BatchedRelatedFieldsMixin:
+
+    """ Validates primary keys submitted for related fields with one `pk__in` query per
+    field, rather than one query per primary key. Applies to the fields generated for the
+    model and to declared `PrimaryKeyRelatedField`s (but not their subclasses). The loaded
+    instances end up in `validated_data`, so they are also used when the serializer is
+    saved. """
+
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+    related_instances_loaded = False
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_serializer = super().many_init(*args, **kwargs)
+        # Items are batched together, unless a custom list serializer is used
+        if type(list_serializer) is ListSerializer:
+            list_serializer.__class__ = BatchedListSerializer
+        return list_serializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for field in fields.values():
+            relation = field.child_relation if isinstance(field, ManyRelatedField) else field
+            # Declared fields are not built from `serializer_related_field`, so are
+            # switched over here. Subclasses may load instances their own way.
+            if type(relation) is PrimaryKeyRelatedField:
+                relation.__class__ = BatchedPrimaryKeyRelatedField
+                relation.batch = None
+        return fields
+
+    def get_batched_relations(self):
+        """ Yields each writable related field along with the field which converts its
+        primary keys, and whether it accepts many of them. """
+        for field in self._writable_fields:
+            if isinstance(field, ManyRelatedField) and isinstance(
+                field.child_relation, BatchedPrimaryKeyRelatedField
+            ):
+                yield field, field.child_relation, True
+            elif isinstance(field, BatchedPrimaryKeyRelatedField):
+                yield field, field, False
+
+    def load_related_instances(self, items):
+        """ Loads the instances referred to by the related fields of every item in `items`. """
+        for field, relation, many in self.get_batched_relations():
+            pks = set()
+            for item in items:
+                if not hasattr(item, "get"):
+                    continue
+                values = item.get(field.field_name)
+                if values is None:
+                    continue
+                if not many:
+                    values = [values]
+                elif isinstance(values, str) or not hasattr(values, "__iter__"):
+                    continue
+                for value in values:
+                    try:
+                        pks.add(relation.to_pk(value))
+                    except Exception:
+                        # Reported when the field itself is validated
+                        continue
+            relation.batch = relation.get_queryset().in_bulk(pks) if pks else {}
+        self.related_instances_loaded = True
+
+    def to_internal_value(self, data):
+        if self.related_instances_loaded:
+            return super().to_internal_value(data)
+        self.load_related_instances([data])
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.related_instances_loaded = False
+
+
+class ModelMutationSerializer(BatchedRelatedFieldsMixin, BaseModelMutationSerializer):
+    pass
+
 
 @get_graphene_type_from_serializer_field.register(MyagiImageField)
 def convert_serializer_field_to_string(field):
@@ -0,0 +1,138 @@
+from graphql.error import GraphQLError
+from graphql.language import ast
+from graphql.language.parser import parse
+from graphql.language.printer import print_ast
+
+from .loaders import LOADERS_ATTR
+from .permissions import PERMISSION_CACHE_ATTR
+
+"""
+Streams every edge of a connection, rather than returning a single page. The query is
+executed repeatedly, each time fetching the page after the last edge which was streamed,
+so memory use does not grow with the size of the connection.
+"""
+
+STREAM_FIRST_VARIABLE = "streamFirst"
+STREAM_AFTER_VARIABLE = "streamAfter"
+PAGINATION_ARGUMENTS = ("first", "last", "after", "before")
+
+
+def _name(value):
+    return ast.Name(value=value)
+
+
+def _variable(name):
+    return ast.Variable(name=_name(name))
+
+
+def _field(name, *sub_fields):
+    selection_set = None
+    if sub_fields:
+        selection_set = ast.SelectionSet(selections=list(sub_fields))
+    return ast.Field(name=_name(name), selection_set=selection_set)
+
+
+def get_operation(document_ast, operation_name=None):
+    operations = [
+        definition
+        for definition in document_ast.definitions
+        if isinstance(definition, ast.OperationDefinition)
+    ]
+    if operation_name is None:
+        if len(operations) != 1:
+            raise GraphQLError(
+                "Must provide operation name if query contains multiple operations."
+            )
+        return operations[0]
+    for operation in operations:
+        if operation.name and operation.name.value == operation_name:
+            return operation
+    raise GraphQLError('Unknown operation named "{}".'.format(operation_name))
+
+
+def prepare_streaming_query(query, operation_name=None):
+    """ Rewrites `query`, which must select a single connection field, so that the page
+    to fetch is set by the `streamFirst` and `streamAfter` variables. Also makes sure the
+    cursor of each edge and the page info needed to fetch the next page are selected.
+    Returns the rewritten query along with the key the connection has in results. """
+    document_ast = parse(query)
+    operation = get_operation(document_ast, operation_name)
+    if operation.operation != "query":
+        raise GraphQLError("Only queries can be streamed.")
+    selections = operation.selection_set.selections
+    if (
+        len(selections) != 1
+        or not isinstance(selections[0], ast.Field)
+        or selections[0].selection_set is None
+    ):
+        raise GraphQLError("Streamed queries must select exactly one connection field.")
+    field = selections[0]
+
+    # Variables which were only used for pagination are removed along with it
+    unused_variables = {STREAM_FIRST_VARIABLE, STREAM_AFTER_VARIABLE}
+    arguments = []
+    for argument in field.arguments or []:
+        if argument.name.value not in PAGINATION_ARGUMENTS:
+            arguments.append(argument)
+        elif isinstance(argument.value, ast.Variable):
+            unused_variables.add(argument.value.name.value)
+    field.arguments = arguments + [
+        ast.Argument(name=_name("first"), value=_variable(STREAM_FIRST_VARIABLE)),
+        ast.Argument(name=_name("after"), value=_variable(STREAM_AFTER_VARIABLE)),
+    ]
+    operation.variable_definitions = [
+        definition
+        for definition in operation.variable_definitions or []
+        if definition.variable.name.value not in unused_variables
+    ] + [
+        ast.VariableDefinition(
+            variable=_variable(STREAM_FIRST_VARIABLE),
+            type=ast.NonNullType(type=ast.NamedType(name=_name("Int"))),
+        ),
+        ast.VariableDefinition(
+            variable=_variable(STREAM_AFTER_VARIABLE),
+            type=ast.NamedType(name=_name("String")),
+        ),
+    ]
+    # Merged with the client's own selections of these fields
+    field.selection_set.selections = list(field.selection_set.selections) + [
+        _field("edges", _field("cursor")),
+        _field("pageInfo", _field("hasNextPage"), _field("endCursor")),
+    ]
+    response_key = (field.alias or field.name).value
+    return print_ast(document_ast), response_key
+
+
+def clear_request_caches(context):
+    """ Forgets the loaders and permission decisions cached on the request, so that
+    they do not accumulate while streaming. """
+    for attr in (LOADERS_ATTR, PERMISSION_CACHE_ATTR):
+        if hasattr(context, attr):
+            delattr(context, attr)
+
+
+def stream_connection(execute, response_key, variables=None, after=None, chunk_size=100):
+    """ Yields each edge of the connection, followed by a final dict containing the
+    `endCursor` of the connection. If executing a page fails, a dict containing the
+    `errors` is yielded instead and streaming stops. `execute` is called with the
+    variables for each page and should return an `ExecutionResult`. A stream which was
+    interrupted can be resumed by passing the cursor of the last edge received as `after`. """
+    while True:
+        page_variables = dict(variables or {})
+        page_variables[STREAM_FIRST_VARIABLE] = chunk_size
+        page_variables[STREAM_AFTER_VARIABLE] = after
+        result = execute(page_variables)
+        if result.errors:
+            yield {"errors": result.errors}
+            return
+        connection = result.data[response_key]
+        if connection is None:
+            yield {"endCursor": after}
+            return
+        for edge in connection["edges"]:
+            yield edge
+        page_info = connection["pageInfo"]
+        after = page_info["endCursor"] or after
+        if not page_info["hasNextPage"]:
+            yield {"endCursor": after}
+            return
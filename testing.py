@@ -1,13 +1,46 @@
 from django.test import TestCase
 from django.contrib.auth.models import Group, AnonymousUser
 from django.contrib.auth import get_user_model
+from django.db import connection, transaction
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 
 import logging
+import re
+from collections import Counter
 
 import graphene
 from graphene.test import Client
 
+from .instrumentation import InstrumentationMiddleware, finish_request
+
+
+def normalize_sql(sql):
+    """ Replaces the literals in `sql` with placeholders, so that queries which only
+    differ in their parameters compare equal. """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    return re.sub(r"\b\d+\b", "?", sql)
+
+
+def format_query_report(queries, profile):
+    """ Describes how many queries each field path made, and which queries were
+    repeated. """
+    lines = ["Queries per field path:"]
+    for path, stats in profile.fields.items():
+        if stats.queries:
+            lines.append("  {}: {}".format(path, stats.queries))
+    if profile.unattributed.queries:
+        lines.append("  (unattributed): {}".format(profile.unattributed.queries))
+    duplicates = [
+        (count, sql)
+        for sql, count in Counter(normalize_sql(q["sql"]) for q in queries).most_common()
+        if count > 1
+    ]
+    if duplicates:
+        lines.append("Repeated queries:")
+        lines.extend("  {}x {}".format(count, sql) for count, sql in duplicates)
+    return "\n".join(lines)
+
 
 class GrapheneTestCase(TestCase):
     def __init__(self, *args, **kwargs):
@@ -29,11 +62,31 @@ class GrapheneTestCase(TestCase):
         c.user = self.user
         return c
 
-    def execute(self, q_string):
+    def get_request(self):
         req = RequestFactory().get("/")
         req.user = self.user
+        return req
+
+    def execute(self, q_string):
         c = self.get_graphene_client()
-        return c.execute(q_string, context_value=req)
+        return c.execute(q_string, context_value=self.get_request())
+
+    def execute_profiled(self, q_string):
+        """ Executes the operation, returning the response along with the SQL queries it
+        made and its `instrumentation.RequestProfile`. """
+        req = self.get_request()
+        c = self.get_graphene_client()
+        with CaptureQueriesContext(connection) as ctx:
+            res = c.execute(
+                q_string,
+                context_value=req,
+                middleware=[InstrumentationMiddleware(sinks=[])],
+            )
+        profile = finish_request(req)
+        assert not res.get(
+            "errors"
+        ), f"GraphQL operation unexpectedly failed with errors. Response was:\n\n{str(res)}"
+        return res, ctx.captured_queries, profile
 
     def assertOK(self, q_string):
         res = self.execute(q_string)
@@ -56,3 +109,43 @@ class GrapheneTestCase(TestCase):
         ), f'Error was raised, but expected error string "{err_string}" was not included. Response was:\n\n{str(res)}'
         logging.disable(level=logging.NOTSET)
         return res
+
+    def assertMaxQueries(self, q_string, n):
+        """ Asserts that the operation succeeds using at most `n` SQL queries. """
+        res, queries, profile = self.execute_profiled(q_string)
+        assert (
+            len(queries) <= n
+        ), f"GraphQL operation made {len(queries)} queries, expected at most {n}.\n\n{format_query_report(queries, profile)}"
+        return res
+
+    def assertQueriesScaleConstant(self, q_string, create_fixtures, sizes=(10, 100)):
+        """ Asserts that the number of SQL queries made by the operation does not depend
+        on the amount of data it returns. `create_fixtures` is called with each of the
+        `sizes` to create that many rows, which are rolled back once the operation has
+        been executed. """
+        runs = []
+        for size in sizes:
+            with transaction.atomic():
+                create_fixtures(size)
+                runs.append((size,) + self.execute_profiled(q_string)[1:])
+                transaction.set_rollback(True)
+        first_size, first_queries, first_profile = runs[0]
+        for size, queries, profile in runs[1:]:
+            if len(queries) == len(first_queries):
+                continue
+            grown = [
+                f"  {path}: {first_profile.get_stats(path).queries} -> {stats.queries}"
+                for path, stats in profile.fields.items()
+                if stats.queries != first_profile.get_stats(path).queries
+            ]
+            if profile.unattributed.queries != first_profile.unattributed.queries:
+                grown.append(
+                    f"  (unattributed): {first_profile.unattributed.queries} -> "
+                    f"{profile.unattributed.queries}"
+                )
+            raise AssertionError(
+                f"GraphQL operation made {len(first_queries)} queries for {first_size} "
+                f"rows, but {len(queries)} queries for {size} rows. Field paths whose "
+                f"queries changed:\n" + "\n".join(grown) + "\n\n"
+                + format_query_report(queries, profile)
+            )
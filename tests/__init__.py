@@ -2,14 +2,43 @@ from django.test import TestCase
 from django.contrib.auth.models import Group, Permission, AnonymousUser
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
-from django.test import RequestFactory
+from django.db import connection, models
+from django.db.models.signals import post_init
+from django.test import RequestFactory, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 
 import base64
+import gc
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
 
 import graphene
 from graphene.test import Client
-from graphql.error import GraphQLError
+from graphene_django.settings import graphene_settings
+from graphql import parse
+from graphql.error import GraphQLError, GraphQLLocatedError
+from promise import Promise
+from rest_framework import serializers as rest_serializers
 
+from .. import (
+    backend,
+    connections,
+    cost,
+    encoding,
+    error_reporting,
+    instrumentation,
+    loaders,
+    mutations,
+    optimizer,
+    permissions,
+    persisted_queries,
+    selections,
+    serializers,
+    throttling,
+    views,
+)
 from ..testing import GrapheneTestCase
 
 from . import schema
@@ -140,6 +169,14 @@ class IntegrationTestCase(GrapheneTestCase):
         )
         self.assertEqual(res["data"]["Group__Item"]["id"], g.id)
 
+        # `get_node` returns instances directly, for code outside of the schema
+        request = RequestFactory().get("/")
+        request.user = self.user
+        info = SimpleNamespace(context=request)
+        self.assertEqual(schema.GroupType.get_node(info, g.id), g)
+        with self.assertRaisesRegex(GraphQLError, "does not exist"):
+            schema.GroupType.get_node(info, 0)
+
     def test_can_create_based_on_permissions(self):
         self.assertError(
             """
@@ -374,3 +411,942 @@ class IntegrationTestCase(GrapheneTestCase):
             % (perm.id, ctype.id)
         )
 
+    def test_related_instances_are_selected_alongside_nodes(self):
+        """ Foreign keys requested on each node should be loaded with `select_related`
+        instead of with one query per node. """
+        paths = optimizer.get_select_related_paths(
+            schema.PermissionModelType,
+            {"name": {}, "contentType": {"appLabel": {}}},
+        )
+        self.assertEqual(paths, ["content_type"])
+        paths = optimizer.get_select_related_paths(
+            schema.PermissionModelType, {"name": {}, "groupSet": {"edges": {}}}
+        )
+        self.assertEqual(paths, [])
+
+    def test_related_instances_are_loaded_in_batches(self):
+        """ Instances requested through an `InstanceLoader` during one execution
+        should be fetched with a single query. """
+        ctypes = list(ContentType.objects.order_by("id")[:3])
+        loader = loaders.InstanceLoader(ContentType)
+        with self.assertNumQueries(1):
+            # Loads are only batched while the executor is draining its queue,
+            # so kick them off from within a promise callback.
+            loaded = (
+                Promise.resolve(None)
+                .then(lambda _: Promise.all([loader.load(c.id) for c in ctypes]))
+                .get()
+            )
+        self.assertEqual(loaded, ctypes)
+
+    def test_related_instances_are_loaded_with_the_base_manager(self):
+        perm = Permission.objects.order_by("id").first()
+        # Hides every row, like a default manager which filters out soft deleted rows
+        class HidingManager(models.Manager):
+            def get_queryset(self):
+                return super().get_queryset().none()
+
+        hiding_manager = HidingManager()
+        hiding_manager.model = ContentType
+        info = SimpleNamespace(context=self.get_request())
+        with mock.patch.object(ContentType._meta, "default_manager", hiding_manager):
+            self.assertFalse(ContentType._default_manager.exists())
+            loader = loaders.get_instance_loader(info, ContentType, "id")
+            loaded = (
+                Promise.resolve(None)
+                .then(lambda _: loader.load(perm.content_type_id))
+                .get()
+            )
+        self.assertEqual(loaded, perm.content_type)
+
+    def test_visibility_of_many_instances_is_checked_in_one_query(self):
+        visible_group = Group.objects.create(name="visible")
+        visible_group.user_set.add(self.user)
+        hidden_group = Group.objects.create(name="hidden")
+        permission = schema.GroupPermission()
+        permission.queryset = Group.objects.all()
+        with self.assertNumQueries(1):
+            viewable = permission.can_view_many(
+                self.user, [visible_group, hidden_group]
+            )
+        self.assertEqual(viewable, {visible_group.pk})
+
+    def test_permission_decisions_are_cached_for_the_request(self):
+        g = Group.objects.create(name="cached")
+        g.user_set.add(self.user)
+        cache = permissions.PermissionCache()
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                self.assertTrue(
+                    cache.can_view(schema.GroupPermission, Group.objects, self.user, g)
+                )
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        cache.invalidate(Group, g.pk)
+        with self.assertNumQueries(1):
+            cache.can_view(schema.GroupPermission, Group.objects, self.user, g)
+        # Decisions are not shared by models which use the same permission class
+        perm = Permission.objects.get(pk=g.pk)
+        self.assertFalse(
+            cache.can_view(schema.GroupPermission, Permission.objects, self.user, perm)
+        )
+
+    def test_invalidated_instances_are_loaded_again(self):
+        g = Group.objects.create(name="before")
+        g.user_set.add(self.user)
+        request = self.get_request()
+        info = SimpleNamespace(context=request)
+        instance_loader = loaders.get_instance_loader(info, Group)
+
+        def load(get_promise):
+            return Promise.resolve(None).then(lambda _: get_promise()).get()
+
+        self.assertEqual(load(lambda: instance_loader.load(g.pk)).name, "before")
+        load(lambda: schema.GroupType.load_viewable_instance(info, g))
+        Group.objects.filter(pk=g.pk).update(name="after")
+        g.user_set.remove(self.user)
+        self.assertEqual(load(lambda: instance_loader.load(g.pk)).name, "before")
+
+        permissions.invalidate_instance(request, Group, g.pk)
+        self.assertEqual(load(lambda: instance_loader.load(g.pk)).name, "after")
+        with self.assertRaises(GraphQLError):
+            load(lambda: schema.GroupType.load_viewable_instance(info, g))
+
+    def test_total_count_is_only_computed_when_requested(self):
+        for name in ["count1", "count2"]:
+            Group.objects.create(name=name).user_set.add(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertOK(
+                """
+                query {
+                    Group__List(first: 1, orderBy: ["id"]) {
+                        edges {
+                            node {
+                                id
+                            }
+                        }
+                    }
+                }
+                """
+            )
+        self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+        res = self.assertOK(
+            """
+            query {
+                Group__List(first: 1, orderBy: ["id"]) {
+                    totalCount
+                    edges {
+                        node {
+                            id
+                        }
+                    }
+                }
+            }
+            """
+        )
+        self.assertEqual(res["data"]["Group__List"]["totalCount"], 2)
+
+    @skipUnlessDBFeature("supports_over_clause")
+    def test_nested_connections_are_loaded_together(self):
+        """ Pages of a nested connection should be loaded for every parent at once,
+        rather than with separate queries for each parent. """
+        ctype = ContentType.objects.get(app_label="sites")
+        groups = [Group.objects.create(name=f"nested{i}") for i in range(3)]
+        for g in groups:
+            g.user_set.add(self.user)
+        for i in range(4):
+            perm = Permission.objects.create(
+                content_type=ctype, name=f"Nested{i}", codename=f"nested{i}"
+            )
+            perm.group_set.add(*groups)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.assertOK(
+                """
+                query {
+                    Permission__List(first: 10, codename_Icontains: "nested", orderBy: ["id"]) {
+                        edges {
+                            node {
+                                codename
+                                groupSet(first: 2, orderBy: ["id"]) {
+                                    pageInfo {
+                                        hasNextPage
+                                    }
+                                    edges {
+                                        node {
+                                            name
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+                """
+            )
+        edges = res["data"]["Permission__List"]["edges"]
+        self.assertEqual(len(edges), 4)
+        for edge in edges:
+            group_set = edge["node"]["groupSet"]
+            self.assertEqual(
+                [e["node"]["name"] for e in group_set["edges"]], ["nested0", "nested1"]
+            )
+            self.assertTrue(group_set["pageInfo"]["hasNextPage"])
+        # One query for the permissions, then one to find the groups on each
+        # page and one to fetch them.
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+    def test_only_requested_columns_are_loaded(self):
+        self.assertEqual(
+            optimizer.get_only_fields(
+                schema.PermissionModelType,
+                {"codename": {}, "contentType": {"appLabel": {}}},
+            ),
+            ["id", "codename", "content_type", "content_type__id", "content_type__app_label"],
+        )
+        ctype = ContentType.objects.get(app_label="sites")
+        Permission.objects.create(content_type=ctype, name="Columns", codename="columns")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertOK(
+                """
+                query {
+                    Permission__List(first: 10, orderBy: ["id"]) {
+                        edges {
+                            node {
+                                codename
+                            }
+                        }
+                    }
+                }
+                """
+            )
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('"auth_permission"."name"', ctx.captured_queries[0]["sql"])
+
+    def test_parsed_documents_are_cached(self):
+        document_backend = backend.CachedDocumentBackend(max_size=1)
+        query = 'query { Group__List(first: 10, orderBy: ["id"]) { edges { node { name } } } }'
+        document = document_backend.document_from_string(schema.test_schema, query)
+        self.assertIs(
+            document_backend.document_from_string(schema.test_schema, query), document
+        )
+        self.assertEqual((document_backend.hits, document_backend.misses), (1, 1))
+        request = RequestFactory().get("/")
+        request.user = self.user
+        result = document.execute(context=request)
+        self.assertIsNone(result.errors)
+        invalid = document_backend.document_from_string(
+            schema.test_schema, "query { unknownField }"
+        )
+        self.assertTrue(invalid.execute(context=request).invalid)
+        # The least recently used document is evicted once `max_size` is reached
+        self.assertEqual(len(document_backend.documents), 1)
+        document_backend.document_from_string(schema.test_schema, query)
+        self.assertEqual(document_backend.misses, 3)
+
+    def test_persisted_queries_can_be_requested_by_hash(self):
+        store = persisted_queries.InMemoryPersistedQueryStore()
+        view = views.ExceptionHandlingGraphQLView.as_view(
+            schema=schema.test_schema, persisted_query_store=store
+        )
+        query = 'query { Group__List(first: 10, orderBy: ["id"]) { edges { node { name } } } }'
+        extensions = {
+            "persistedQuery": {
+                "version": 1,
+                "sha256Hash": persisted_queries.get_query_hash(query),
+            }
+        }
+
+        def post(data):
+            request = RequestFactory().post(
+                "/graphql", json.dumps(data), content_type="application/json"
+            )
+            request.user = self.user
+            return json.loads(view(request).content.decode())
+
+        response = post({"extensions": extensions})
+        self.assertEqual(response["errors"][0]["message"], "PersistedQueryNotFound")
+        self.assertIn("data", post({"query": query, "extensions": extensions}))
+        self.assertEqual(
+            post({"extensions": extensions}), {"data": {"Group__List": {"edges": []}}}
+        )
+        with self.assertRaises(persisted_queries.PersistedQueryNotAllowed):
+            persisted_queries.resolve_persisted_query(
+                store, "query { __typename }", None, whitelist_only=True
+            )
+
+    def test_selections_include_fragments_and_are_cached(self):
+        document = parse(
+            """
+            query {
+                Group__List(first: 10, orderBy: ["id"]) {
+                    edges { node { ...GroupName ... on GroupType { id } } }
+                    edges { node { name } }
+                }
+            }
+            fragment GroupName on GroupType { name }
+            """
+        )
+        field_ast = document.definitions[0].selection_set.selections[0]
+        fragments = {document.definitions[1].name.value: document.definitions[1]}
+        cache = selections.SelectionCache()
+        selection = cache.get_selection(field_ast, fragments)
+        self.assertEqual(
+            optimizer.get_node_selection(selection), {"name": {}, "id": {}}
+        )
+        self.assertIs(cache.get_selection(field_ast, fragments), selection)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        with self.assertRaises(TypeError):
+            selection["edges"] = {}
+
+    def test_can_create_and_update_in_bulk(self):
+        g = Group.objects.create(name="bulk1")
+        other = Group.objects.create(name="bulk2")
+        mutation = """
+            mutation {
+                Group__BulkCreateOrUpdate(input: {items: [
+                    {name: "bulk3"}, {id: %d, name: "renamed"}, {id: %d, name: "denied"}
+                ]}) {
+                    ok
+                    results { name }
+                    errors { index field messages }
+                }
+            }
+            """ % (g.id, other.id)
+        g.user_set.add(self.user)
+        res = self.assertOK(mutation)["data"]["Group__BulkCreateOrUpdate"]
+        self.assertFalse(res["ok"])
+        self.assertEqual(
+            res["errors"],
+            [
+                {
+                    "index": 2,
+                    "field": None,
+                    "messages": ["You do not have permission to perform this mutation"],
+                }
+            ],
+        )
+        self.assertFalse(Group.objects.filter(name="bulk3").exists())
+        other.user_set.add(self.user)
+        res = self.assertOK(mutation.replace('"bulk3"}', '"%s"}' % "bulk2"))
+        errors = res["data"]["Group__BulkCreateOrUpdate"]["errors"]
+        self.assertEqual([(e["index"], e["field"]) for e in errors], [(0, "name")])
+        res = self.assertOK(mutation)["data"]["Group__BulkCreateOrUpdate"]
+        self.assertTrue(res["ok"])
+        self.assertEqual(
+            [r["name"] for r in res["results"]], ["bulk3", "renamed", "denied"]
+        )
+        g.refresh_from_db()
+        self.assertEqual(g.name, "renamed")
+        self.assertTrue(Group.objects.filter(name="bulk3").exists())
+
+    def test_unique_values_are_checked_across_a_bulk_batch(self):
+        g = Group.objects.create(name="bulkUnique")
+        g.user_set.add(self.user)
+        res = self.assertOK(
+            """
+            mutation {
+                Group__BulkCreateOrUpdate(input: {items: [
+                    {name: "same"}, {name: "same"}, {id: %d, name: "same"}
+                ]}) {
+                    ok
+                    errors { index field messages }
+                }
+            }
+            """
+            % g.id
+        )["data"]["Group__BulkCreateOrUpdate"]
+        self.assertFalse(res["ok"])
+        self.assertEqual(
+            [(e["index"], e["field"]) for e in res["errors"]], [(1, "name"), (2, "name")]
+        )
+        self.assertFalse(Group.objects.filter(name="same").exists())
+
+    def test_malformed_ids_are_reported_per_bulk_item(self):
+        g = Group.objects.create(name="bulkMalformed")
+        g.user_set.add(self.user)
+        res = self.assertOK(
+            """
+            mutation {
+                Group__BulkCreateOrUpdate(input: {items: [
+                    {id: %d, name: "wellFormed"}, {id: "notAnId", name: "malformed"}
+                ]}) {
+                    ok
+                    errors { index field messages }
+                }
+            }
+            """
+            % g.id
+        )["data"]["Group__BulkCreateOrUpdate"]
+        self.assertFalse(res["ok"])
+        self.assertEqual([(e["index"], e["field"]) for e in res["errors"]], [(1, "id")])
+        self.assertEqual(Group.objects.get(id=g.id).name, "bulkMalformed")
+
+    def test_can_delete_in_bulk(self):
+        deletable = Group.objects.create(name="bulk_delete1")
+        denied = Group.objects.create(name="bulk_delete2")
+        deletable.user_set.add(self.user)
+        res = self.assertOK(
+            """
+            mutation {
+                Group__BulkDelete(input: {ids: [%d, %d, 0]}) {
+                    ok
+                    deletedIds
+                    deniedIds
+                    missingIds
+                }
+            }
+            """
+            % (deletable.id, denied.id)
+        )
+        self.assertEqual(
+            res["data"]["Group__BulkDelete"],
+            {
+                "ok": False,
+                "deletedIds": [deletable.id],
+                "deniedIds": [denied.id],
+                "missingIds": [0],
+            },
+        )
+        self.assertFalse(Group.objects.filter(id=deletable.id).exists())
+        self.assertTrue(Group.objects.filter(id=denied.id).exists())
+
+    def test_instances_are_looked_up_with_permissions_for_update(self):
+        g = Group.objects.create(name="lookup")
+        g.user_set.add(self.user)
+        denied = Group.objects.create(name="lookupDenied")
+        mutation = """
+            mutation {
+                LookedUpGroup__Update(input: {id: %d, name: "lookedUp"}) {
+                    ok
+                    result { name }
+                }
+            }
+            """
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.assertOK(mutation % g.id)
+        self.assertEqual(res["data"]["LookedUpGroup__Update"]["result"], {"name": "lookedUp"})
+        lookups = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if query["sql"].startswith("SELECT") and '"auth_user_groups"' in query["sql"]
+        ]
+        # The permission check is part of the query which fetches the instance
+        self.assertEqual(len(lookups), 1)
+        self.assertIn('"auth_group"."name"', lookups[0])
+        self.assertError(mutation % 0, "does not exist")
+        self.assertError(mutation % denied.id, "permission")
+        self.assertEqual(Group.objects.get(id=denied.id).name, "lookupDenied")
+
+    def test_instances_are_looked_up_with_permissions_for_delete(self):
+        g = Group.objects.create(name="lookupDelete")
+        g.user_set.add(self.user)
+        denied = Group.objects.create(name="lookupDeleteDenied")
+        mutation = "mutation { LookedUpGroup__Delete(input: {id: %d}) { ok } }"
+        self.assertError(mutation % denied.id, "permission")
+        self.assertTrue(Group.objects.filter(id=denied.id).exists())
+        self.assertOK(mutation % g.id)
+        self.assertFalse(Group.objects.filter(id=g.id).exists())
+
+    def test_mutations_accept_serializers_without_a_model(self):
+        class NameSerializer(rest_serializers.Serializer):
+            name = rest_serializers.CharField()
+
+        for lookup in (False, True):
+
+            class NameMutation(mutations.PermissionedSerializerMutation):
+                class Meta:
+                    output_type = schema.GroupType
+                    serializer_class = NameSerializer
+                    model_class = Group
+                    permission_class = schema.GroupPermission
+                    permissioned_lookup = lookup
+
+            self.assertEqual(NameMutation._meta.model_class, Group)
+            self.assertEqual(NameMutation.serializer_relations, ([], []))
+
+    def test_related_ids_are_validated_in_one_query(self):
+        class GroupPermissionsSerializer(serializers.ModelMutationSerializer):
+            permission_ids = serializers.ManyToManyIDField(
+                queryset=Permission.objects.all(), required=False
+            )
+
+            class Meta:
+                model = Group
+                fields = ["name", "permissions", "permission_ids"]
+
+        ids = list(Permission.objects.values_list("id", flat=True)[:20])
+        serializer = GroupPermissionsSerializer(
+            data={"name": "batched", "permissions": ids, "permission_ids": ids}
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        # One query for each related field, plus one to check the name is unique
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(
+            [p.id for p in serializer.validated_data["permissions"]], ids
+        )
+        many = GroupPermissionsSerializer(
+            data=[{"name": "a", "permissions": ids[:5]}, {"name": "b", "permissions": [0]}],
+            many=True,
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(many.is_valid())
+        # Related instances are loaded for every item at once
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(list(many.errors[1]), ["permissions"])
+
+        class DeclaredPermissionsSerializer(serializers.ModelMutationSerializer):
+            permissions = rest_serializers.PrimaryKeyRelatedField(
+                queryset=Permission.objects.all(), many=True
+            )
+
+            class Meta:
+                model = Group
+                fields = ["name", "permissions"]
+
+        declared = DeclaredPermissionsSerializer(
+            data=[{"name": "c", "permissions": ids}, {"name": "d", "permissions": [0]}],
+            many=True,
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(declared.is_valid())
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(list(declared.errors[1]), ["permissions"])
+
+    def test_mutation_results_are_read_with_related_instances(self):
+        ctype = ContentType.objects.get(app_label="sites")
+        perm = Permission.objects.create(content_type=ctype, name="Result", codename="result")
+        mutation = """
+            mutation {
+                Permission__Update(input: {
+                    id: %d, name: "Renamed", codename: "result", contentType: %d
+                }) {
+                    result {
+                        name
+                        contentType {
+                            appLabel
+                        }
+                    }
+                }
+            }
+            """ % (perm.id, ctype.id)
+        with mock.patch.object(
+            schema.ContentTypePermission,
+            "get_viewable",
+            lambda permission, user: permission.queryset.all(),
+        ):
+            self.assertMaxQueries(mutation, 7)
+            res, queries, _ = self.execute_profiled(mutation)
+        self.assertEqual(
+            res["data"]["Permission__Update"]["result"],
+            {"name": "Renamed", "contentType": {"appLabel": "sites"}},
+        )
+        perm.refresh_from_db()
+        self.assertEqual(perm.name, "Renamed")
+        # Queries made once the instance has been saved
+        (update_index,) = [
+            i for i, query in enumerate(queries) if query["sql"].startswith("UPDATE")
+        ]
+        selects = [
+            query["sql"].split(" FROM ")[:2]
+            for query in queries[update_index + 1 :]
+            if " FROM " in query["sql"]
+        ]
+        # The result is re-read with its content type selected alongside it, so the
+        # content type is not loaded on its own
+        self.assertTrue(
+            any(
+                '"django_content_type"."app_label"' in columns
+                and tables.startswith('"auth_permission"')
+                for columns, tables in selects
+            )
+        )
+        self.assertFalse(
+            any(
+                '"django_content_type"."app_label"' in columns
+                and tables.startswith('"django_content_type"')
+                for columns, tables in selects
+            )
+        )
+
+    def test_cursors_are_encoded_without_a_paginator(self):
+        ordering = ["-content_type__app_label", "-id"]
+        perm = Permission.objects.select_related("content_type").first()
+        paginator = connections.get_paginator_for_queryset(
+            Permission.objects.all(), ordering
+        )
+        self.assertEqual(
+            connections.encode_cursor(perm, ordering), paginator.cursor(perm)
+        )
+
+    def test_connection_edges_are_compact(self):
+        res = self.assertOK(
+            """
+            query {
+                Permission__List(first: 3, orderBy: ["-id"]) {
+                    edges {
+                        cursor
+                    }
+                }
+            }
+            """
+        )
+        perms = Permission.objects.order_by("-id")[:3]
+        self.assertEqual(
+            [edge["cursor"] for edge in res["data"]["Permission__List"]["edges"]],
+            [connections.encode_cursor(perm, ["-id"]) for perm in perms],
+        )
+        edge = connections.CompactEdge(perms[0], lambda node: "cursor")
+        self.assertEqual(edge.cursor, "cursor")
+        with self.assertRaises(AttributeError):
+            edge.extra = True
+
+    def test_connections_can_be_streamed(self):
+        view = views.StreamingConnectionView.as_view(
+            schema=schema.test_schema, chunk_size=2
+        )
+        query = """
+            query Export($first: Int) {
+                Permission__List(first: $first, orderBy: ["id"]) {
+                    edges { node { codename } }
+                }
+            }
+        """
+        codenames = list(Permission.objects.order_by("id").values_list("codename", flat=True))
+
+        def stream(after=None):
+            data = {"query": query, "variables": {"first": 1}}
+            if after:
+                data["after"] = after
+            request = RequestFactory().post(
+                "/graphql", json.dumps(data), content_type="application/json"
+            )
+            request.user = self.user
+            response = view(request)
+            return [json.loads(line) for line in b"".join(response).splitlines()]
+
+        lines = stream()
+        self.assertEqual([line["node"]["codename"] for line in lines[:-1]], codenames)
+        self.assertEqual(lines[-1], {"endCursor": lines[-2]["cursor"]})
+        resumed = stream(after=lines[2]["cursor"])
+        self.assertEqual(resumed[:-1], lines[3:-1])
+
+    def test_streamed_pages_are_checked_and_charged(self):
+        query = """
+            query {
+                Permission__List(orderBy: ["id"]) {
+                    edges { node { codename } }
+                }
+            }
+        """
+
+        def stream(**kwargs):
+            view = views.StreamingConnectionView.as_view(
+                schema=schema.test_schema, chunk_size=2, **kwargs
+            )
+            request = RequestFactory().post(
+                "/graphql", json.dumps({"query": query}), content_type="application/json"
+            )
+            request.user = self.user
+            return [json.loads(line) for line in b"".join(view(request)).splitlines()]
+
+        lines = stream(max_query_cost=1)
+        self.assertEqual(len(lines), 1)
+        self.assertIn("exceeds the maximum allowed cost of 1", lines[0]["errors"][0]["message"])
+
+        # Each page is charged separately, so the stream stops once the budget runs out
+        page_throttle = throttling.CostThrottle(capacity=8, refill_rate=1e-9)
+        lines = stream(throttle=page_throttle)
+        self.assertEqual(len(lines), 5)
+        self.assertIn("Request was throttled", lines[-1]["errors"][0]["message"])
+
+    def test_expensive_queries_are_rejected_before_execution(self):
+        query = """
+            query {
+                Group__List(first: 10, orderBy: ["id"]) {
+                    edges {
+                        node {
+                            name
+                            permissions(first: 50, orderBy: ["id"]) {
+                                edges { node { ...PermissionFields } }
+                            }
+                        }
+                    }
+                }
+            }
+            fragment PermissionFields on PermissionModelType { codename }
+        """
+        self.assertEqual(
+            cost.get_query_cost(schema.test_schema, parse(query)), 10 + 10 * 50
+        )
+        view = views.ExceptionHandlingGraphQLView.as_view(
+            schema=schema.test_schema, max_query_cost=500
+        )
+        request = RequestFactory().post(
+            "/graphql", json.dumps({"query": query}), content_type="application/json"
+        )
+        request.user = self.user
+        with CaptureQueriesContext(connection) as ctx:
+            response = view(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exceeds the maximum allowed cost of 500", response.content.decode())
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_connection_costs_use_the_limit_of_the_field(self):
+        class Query(graphene.ObjectType):
+            groups = connections.PermissionedConnectionField(
+                schema.GroupType,
+                schema.GroupPermission,
+                filterset_class=schema.GroupType.filterset_class,
+                max_limit=1000,
+            )
+
+        export_schema = graphene.Schema(query=Query)
+        query = """
+            query {
+                groups(%s orderBy: ["id"]) {
+                    edges {
+                        node {
+                            permissions(first: 1000, orderBy: ["id"]) {
+                                edges { node { codename } }
+                            }
+                        }
+                    }
+                }
+            }
+        """
+        with mock.patch.object(graphene_settings, "RELAY_CONNECTION_MAX_LIMIT", None):
+            self.assertEqual(
+                cost.get_query_cost(export_schema, parse(query % "")),
+                1000 + 1000 * 1000,
+            )
+            self.assertEqual(
+                cost.get_query_cost(export_schema, parse(query % "first: 5000,")),
+                5000 + 5000 * 1000,
+            )
+
+    def test_requests_are_throttled_by_their_cost(self):
+        query = 'query { Group__List(first: 10, orderBy: ["id"]) { edges { node { name } } } }'
+        for i in range(5):
+            Group.objects.create(name="throttled{}".format(i)).user_set.add(self.user)
+        user_throttle = throttling.CostThrottle(capacity=15, refill_rate=1e-9)
+        view = views.ExceptionHandlingGraphQLView.as_view(
+            schema=schema.test_schema, throttle=user_throttle
+        )
+
+        def execute():
+            request = RequestFactory().post(
+                "/graphql", json.dumps({"query": query}), content_type="application/json"
+            )
+            request.user = self.user
+            with CaptureQueriesContext(connection) as ctx:
+                response = view(request)
+            return response, len(ctx.captured_queries)
+
+        response, num_queries = execute()
+        self.assertEqual(response.status_code, 200)
+        rows = len(json.loads(response.content.decode())["data"]["Group__List"]["edges"])
+        self.assertEqual(rows, 5)
+        # The estimated cost of 10 is replaced by the actual cost
+        tokens = user_throttle.get_tokens(
+            user_throttle.store.buckets["user:{}".format(self.user.pk)], time.time()
+        )
+        self.assertAlmostEqual(tokens, 15 - num_queries - rows, places=3)
+
+        response, num_queries = execute()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Request was throttled", response.content.decode())
+        self.assertEqual(num_queries, 0)
+
+        # Rows are only counted while usage is being measured
+        self.assertFalse(post_init.has_listeners(Group))
+        with throttling.measure_usage() as usage:
+            self.assertTrue(post_init.has_listeners(Group))
+            list(Group.objects.filter(name__startswith="throttled"))
+        self.assertEqual((usage.queries, usage.rows), (1, 5))
+        self.assertFalse(post_init.has_listeners(Group))
+
+        store = throttling.LocalThrottleStore(max_size=2)
+        small_throttle = throttling.CostThrottle(capacity=10, refill_rate=1, store=store)
+        for key in ("a", "b", "c"):
+            small_throttle.consume(key, 1)
+        self.assertEqual(list(store.buckets), ["b", "c"])
+
+    def test_requests_can_be_profiled(self):
+        for i in range(3):
+            Group.objects.create(name="profiled{}".format(i)).user_set.add(self.user)
+        ring_buffer = instrumentation.RingBufferSink(max_size=1)
+        view = views.ExceptionHandlingGraphQLView.as_view(
+            schema=schema.test_schema,
+            middleware=[
+                instrumentation.InstrumentationMiddleware(
+                    sinks=[ring_buffer, instrumentation.ExtensionsSink(debug_only=False)]
+                )
+            ],
+        )
+        query = 'query { Group__List(first: 10, orderBy: ["id"]) { edges { node { name } } } }'
+        request = RequestFactory().post(
+            "/graphql", json.dumps({"query": query}), content_type="application/json"
+        )
+        request.user = self.user
+        with CaptureQueriesContext(connection) as ctx:
+            response = view(request)
+        self.assertEqual(response.status_code, 200)
+
+        (profile,) = ring_buffer.get_profiles()
+        stats = profile.fields["Group__List"]
+        self.assertEqual(stats.calls, 1)
+        self.assertGreater(stats.permission_time, 0)
+        self.assertEqual(profile.fields["Group__List.edges.node.name"].calls, 3)
+        self.assertGreater(profile.totals.queries, 0)
+        self.assertEqual(profile.totals.queries, len(ctx.captured_queries))
+        extensions = json.loads(response.content.decode())["extensions"]
+        self.assertEqual(
+            extensions["profile"]["totals"]["queries"], len(ctx.captured_queries)
+        )
+
+    def test_profiles_are_completed_without_the_view(self):
+        ring_buffer = instrumentation.RingBufferSink()
+        request = RequestFactory().get("/")
+        request.user = self.user
+        res = schema.test_schema.execute(
+            'query { Group__List(first: 10, orderBy: ["id"]) { edges { node { name } } } }',
+            context_value=request,
+            middleware=[instrumentation.InstrumentationMiddleware(sinks=[ring_buffer])],
+        )
+        self.assertFalse(res.errors)
+        self.assertEqual(ring_buffer.get_profiles(), [])
+        del request
+        gc.collect()
+        (profile,) = ring_buffer.get_profiles()
+        self.assertIn("Group__List", profile.fields)
+        # Queries made after the request are not recorded
+        self.assertIsNone(instrumentation._get_current_stats())
+
+    def test_query_counts_can_be_asserted(self):
+        query = """
+            query {
+                Group__List(first: 100, orderBy: ["id"]) {
+                    edges { node { name permissions(first: 10, orderBy: ["id"]) { edges { node { codename } } } } }
+                }
+            }
+        """
+        permission = Permission.objects.first()
+
+        def create_groups(size):
+            for i in range(size):
+                group = Group.objects.create(name="scaled{}".format(i))
+                group.user_set.add(self.user)
+                group.permissions.add(permission)
+
+        self.assertQueriesScaleConstant(query, create_groups, sizes=(2, 10))
+        create_groups(2)
+        self.assertMaxQueries(query, 10)
+        with self.assertRaisesRegex(AssertionError, "Group__List: "):
+            self.assertMaxQueries(query, 0)
+
+    def test_errors_are_reported_in_the_background_without_duplicates(self):
+        class Client(object):
+            def __init__(self):
+                self.captured = []
+
+            def captureException(self, exc_info=None, **kwargs):
+                self.captured.append((exc_info[1], kwargs))
+
+        def make_error(path, message="Failed"):
+            try:
+                raise ValueError(message)
+            except ValueError as e:
+                return GraphQLLocatedError([], original_error=e, path=path)
+
+        client = Client()
+        reporter = error_reporting.ErrorReporter(client=client, print_tracebacks=False)
+        for i in range(200):
+            reporter.report(make_error(["Group__List", "edges", i, "node", "name"]))
+        reporter.report(make_error(["Group__Item"], "Other"))
+        reporter.flush()
+        self.assertEqual(
+            [(str(e), kwargs["extra"]["field_path"]) for e, kwargs in client.captured],
+            [
+                ("Failed", "Group__List.edges.node.name"),
+                ("Other", "Group__Item"),
+            ],
+        )
+
+        # Once the window has passed, the number of suppressed duplicates is reported
+        reporter.dedupe_window = 0
+        reporter.report(make_error(["Group__List", "edges", 0, "node", "name"]))
+        reporter.flush()
+        self.assertEqual(client.captured[-1][1]["extra"]["suppressed_duplicates"], 199)
+
+        unsampled = error_reporting.ErrorReporter(client=client, sample_rate=0)
+        unsampled.report(make_error(["Group__Item"]))
+        unsampled.flush()
+        self.assertEqual(len(client.captured), 3)
+
+    def test_errors_are_reported_with_their_request(self):
+        class Client(object):
+            def __init__(self):
+                self.captured = []
+
+            def get_data_from_request(self, request):
+                return {"request": {"url": request.path}, "user": {"id": request.user.pk}}
+
+            def captureException(self, exc_info=None, **kwargs):
+                self.captured.append(kwargs)
+
+        client = Client()
+        reporter = error_reporting.ErrorReporter(client=client, print_tracebacks=False)
+        view = views.ExceptionHandlingGraphQLView.as_view(
+            schema=schema.test_schema, error_reporter=reporter
+        )
+        request = RequestFactory().post(
+            "/graphql",
+            json.dumps({"query": "query { Group__Item(id: 0) { id } }"}),
+            content_type="application/json",
+        )
+        request.user = self.user
+        view(request)
+        reporter.flush()
+        self.assertEqual(len(client.captured), 1)
+        self.assertEqual(
+            client.captured[0]["data"],
+            {"request": {"url": "/graphql"}, "user": {"id": self.user.pk}},
+        )
+
+    def test_responses_are_encoded_compactly(self):
+        data = {"data": {"a": [1, {"b": None}], 1: "é", "big": 2 ** 70}}
+        encoded = encoding.fast_json_dumps(data)
+        if isinstance(encoded, bytes):
+            self.assertIsNotNone(encoding.orjson)
+            encoded = encoded.decode("utf-8")
+        self.assertNotIn(" ", encoded)
+        self.assertEqual(
+            json.loads(encoded), {"data": {"a": [1, {"b": None}], "1": "é", "big": 2 ** 70}}
+        )
+
+        # Views accept the bytes which orjson returns
+        query = 'query { Group__List(first: 1, orderBy: ["id"]) { edges { node { name } } } }'
+
+        def post(view_class, data, **kwargs):
+            view = view_class.as_view(schema=schema.test_schema, **kwargs)
+            request = RequestFactory().post(
+                "/graphql", json.dumps(data), content_type="application/json"
+            )
+            request.user = self.user
+            response = view(request)
+            content = b"".join(response) if response.streaming else response.content
+            return [json.loads(line) for line in content.splitlines()]
+
+        with mock.patch.object(views, "fast_json_dumps", lambda d: json.dumps(d).encode()):
+            self.assertEqual(
+                post(views.ExceptionHandlingGraphQLView, {"query": query}),
+                [{"data": {"Group__List": {"edges": []}}}],
+            )
+            self.assertEqual(
+                post(views.ExceptionHandlingGraphQLView, [{"query": query}], batch=True),
+                [[{"data": {"Group__List": {"edges": []}}, "id": None, "status": 200}]],
+            )
+            self.assertEqual(
+                post(views.StreamingConnectionView, {"query": query}),
+                [{"endCursor": None}],
+            )
@@ -0,0 +1,258 @@
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from unittest import skipUnless
+
+from .. import encoding
+from ..testing import GrapheneTestCase
+
+from . import schema
+
+"""
+Benchmarks for the test schema, run with
+
+    GRAPHENE_DJANGO_PLUS_BENCHMARKS=1 ./manage.py test graphene_django_plus.tests.benchmarks
+
+against the local (SQLite) test database. Each benchmark executes an operation, or encodes
+a response, `GRAPHENE_DJANGO_PLUS_BENCHMARK_ITERATIONS` times after a warm-up run, then once
+more to count its SQL queries and measure its peak memory use. A table of the results is
+printed once every benchmark has run.
+"""
+
+BENCHMARK_ENV_VAR = "GRAPHENE_DJANGO_PLUS_BENCHMARKS"
+ITERATIONS = int(os.environ.get("GRAPHENE_DJANGO_PLUS_BENCHMARK_ITERATIONS", 50))
+# Number of groups visible to the user, and of permissions on each group
+NUM_GROUPS = 200
+PERMISSIONS_PER_GROUP = 5
+
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class BenchmarkResult(object):
+    def __init__(self, name, latencies, queries, peak_memory):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.queries = queries
+        self.peak_memory = peak_memory
+
+    HEADER = "{:<40} {:>9} {:>9} {:>9} {:>8} {:>10}".format(
+        "benchmark", "p50 ms", "p90 ms", "p99 ms", "queries", "peak KiB"
+    )
+
+    def format(self):
+        return "{:<40} {:>9.2f} {:>9.2f} {:>9.2f} {:>8} {:>10.1f}".format(
+            self.name,
+            percentile(self.latencies, 50) * 1000,
+            percentile(self.latencies, 90) * 1000,
+            percentile(self.latencies, 99) * 1000,
+            self.queries,
+            self.peak_memory / 1024,
+        )
+
+
+@skipUnless(
+    os.environ.get(BENCHMARK_ENV_VAR), "Set {} to run benchmarks".format(BENCHMARK_ENV_VAR)
+)
+class SchemaBenchmarks(GrapheneTestCase):
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.benchmark_user = get_user_model().objects.create(
+            first_name="Benchmark", last_name="User"
+        )
+        permissions = list(Permission.objects.order_by("id")[:PERMISSIONS_PER_GROUP])
+        Group.objects.bulk_create(
+            [Group(name="benchmark{}".format(i)) for i in range(NUM_GROUPS)]
+        )
+        # Re-read, as not every database returns primary keys from bulk inserts
+        groups = list(Group.objects.filter(name__startswith="benchmark").order_by("id"))
+        cls.benchmark_user.groups.add(*groups)
+        Group.permissions.through.objects.bulk_create(
+            [
+                Group.permissions.through(group=group, permission=permission)
+                for group in groups
+                for permission in permissions
+            ]
+        )
+        cls.group_ids = [group.id for group in groups]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls.results:
+            lines = [BenchmarkResult.HEADER] + [result.format() for result in cls.results]
+            sys.stderr.write("\n\n" + "\n".join(lines) + "\n")
+
+    def setUp(self):
+        self.set_user(self.benchmark_user)
+        self.set_schema(schema.test_schema)
+
+    def benchmark(self, name, make_query, iterations=ITERATIONS):
+        """ Benchmarks the operations returned by `make_query`, which is called with the
+        number of each run (starting at 0). """
+        run = iter(range(iterations + 2))
+        self.assertOK(make_query(next(run)))
+
+        latencies = []
+        for i in range(iterations):
+            q_string = make_query(next(run))
+            start = time.perf_counter()
+            res = self.execute(q_string)
+            latencies.append(time.perf_counter() - start)
+            self.assertFalse(res.get("errors"), res)
+
+        q_string = make_query(next(run))
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertOK(q_string)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.results.append(
+            BenchmarkResult(name, latencies, len(ctx.captured_queries), peak_memory)
+        )
+
+    def benchmark_function(self, name, function, iterations=ITERATIONS):
+        """ Benchmarks calls to `function`, which should not query the database. """
+        function()
+        latencies = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            function()
+            latencies.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            function()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.results.append(BenchmarkResult(name, latencies, 0, peak_memory))
+
+    def test_list_page_sizes(self):
+        for first in (10, 50, 100):
+            self.benchmark(
+                "Group__List first={}".format(first),
+                lambda i: """
+                query {
+                    Group__List(first: %d, orderBy: ["id"]) {
+                        edges { cursor node { id name } }
+                        pageInfo { hasNextPage endCursor }
+                    }
+                }
+                """
+                % first,
+            )
+
+    def test_list_nesting_depths(self):
+        permissions = 'permissions(first: 10, orderBy: ["id"]) { edges { node { id codename %s } } }'
+        groups = 'groupSet(first: 10, orderBy: ["id"]) { edges { node { id name } } }'
+        for depth, selection in (
+            (1, ""),
+            (2, permissions % ""),
+            (3, permissions % groups),
+        ):
+            self.benchmark(
+                "Group__List first=50 depth={}".format(depth),
+                lambda i: """
+                query {
+                    Group__List(first: 50, orderBy: ["id"]) {
+                        edges { node { id name %s } }
+                    }
+                }
+                """
+                % selection,
+            )
+
+    def test_node_lookup(self):
+        self.benchmark(
+            "Group__Item",
+            lambda i: "query { Group__Item(id: %d) { id name } }"
+            % self.group_ids[i % NUM_GROUPS],
+        )
+
+    def test_mutations(self):
+        self.benchmark(
+            "Group__Create",
+            lambda i: 'mutation { Group__Create(input: {name: "created%d"}) { ok } }' % i,
+        )
+        self.benchmark(
+            "Group__Update",
+            lambda i: 'mutation { Group__Update(input: {id: %d, name: "updated%d"}) { ok } }'
+            % (self.group_ids[i % NUM_GROUPS], i),
+        )
+        self.benchmark(
+            "Group__Delete",
+            lambda i: "mutation { Group__Delete(input: {id: %d}) { ok } }"
+            % self.group_ids[i % NUM_GROUPS],
+            iterations=min(ITERATIONS, NUM_GROUPS - 2),
+        )
+
+    def test_bulk_mutations(self):
+        def items(i):
+            ids = self.group_ids[i * 10 % NUM_GROUPS :][:10]
+            updates = ['{id: %d, name: "bulk%d_%d"}' % (id, i, id) for id in ids]
+            creates = ['{name: "bulkNew%d_%d"}' % (i, j) for j in range(10)]
+            return ", ".join(updates + creates)
+
+        self.benchmark(
+            "Group__BulkCreateOrUpdate 20 items",
+            lambda i: "mutation { Group__BulkCreateOrUpdate(input: {items: [%s]}) { ok } }"
+            % items(i),
+        )
+        self.benchmark(
+            "Group__BulkDelete 10 ids",
+            lambda i: "mutation { Group__BulkDelete(input: {ids: [%s]}) { ok } }"
+            % ", ".join(str(id) for id in self.group_ids[i * 10 % NUM_GROUPS :][:10]),
+            iterations=NUM_GROUPS // 10 - 2,
+        )
+
+    def test_json_encoding(self):
+        response = {
+            "data": {
+                "Group__List": {
+                    "edges": [
+                        {
+                            "cursor": "MTIzNHxncm91cA==",
+                            "node": {
+                                "id": i,
+                                "name": "benchmark group \u00e9 {}".format(i),
+                                "permissions": {
+                                    "edges": [
+                                        {"node": {"id": j, "codename": "can_do_{}".format(j)}}
+                                        for j in range(PERMISSIONS_PER_GROUP)
+                                    ]
+                                },
+                            },
+                        }
+                        for i in range(1000)
+                    ],
+                    "pageInfo": {"hasNextPage": True, "endCursor": "MTIzNHxncm91cA=="},
+                }
+            }
+        }
+        self.benchmark_function(
+            "json.dumps 1000 edges",
+            lambda: json.dumps(response, separators=(",", ":")),
+        )
+        self.benchmark_function(
+            "stdlib_json_dumps 1000 edges",
+            lambda: encoding.stdlib_json_dumps(response),
+        )
+        self.benchmark_function(
+            "fast_json_dumps ({}) 1000 edges".format(
+                "orjson" if encoding.orjson else "stdlib"
+            ),
+            lambda: encoding.fast_json_dumps(response),
+        )
@@ -5,7 +5,7 @@ from django.contrib.auth import get_user_model
 import graphene
 from graphql.error import GraphQLError
 
-from .. import types, factories, serializers, permissions, filters
+from .. import types, factories, mutations, serializers, permissions, filters
 
 """ 
 Integration tests which use the Group model to create a basic schema and
@@ -45,7 +45,32 @@ class GroupMutationSerializer(serializers.ModelMutationSerializer):
 class GroupSchemaFieldsFactory(factories.PermissionedSchemaFieldsFactory):
     type_class = GroupType
     mutation_serializer_class = GroupMutationSerializer
-    mutation_operations = ["create", "update", "delete"]
+    mutation_operations = [
+        "create",
+        "update",
+        "delete",
+        "bulk_create_or_update",
+        "bulk_delete",
+    ]
+
+
+class LookedUpGroupUpdateMutation(mutations.PermissionedSerializerMutation):
+    class Meta:
+        output_type = GroupType
+        edge_output_type = GroupSchemaFieldsFactory.ListField().type.Edge
+        serializer_class = GroupMutationSerializer
+        permission_class = GroupPermission
+        model_operations = ["update"]
+        permissioned_lookup = True
+        select_for_update = True
+
+
+class LookedUpGroupDeleteMutation(mutations.PermissionedDeletionMutation):
+    class Meta:
+        model = Group
+        permission_class = GroupPermission
+        permissioned_lookup = True
+        select_for_update = True
 
 
 class PermissionModelPermission(permissions.Permission):
@@ -130,7 +155,8 @@ class Mutation(
     GroupSchemaFieldsFactory.MutationFieldsClass(),
     PermissionModelSchemaFieldsFactory.MutationFieldsClass(),
 ):
-    pass
+    LookedUpGroup___Update = LookedUpGroupUpdateMutation.Field()
+    LookedUpGroup___Delete = LookedUpGroupDeleteMutation.Field()
 
 
 test_schema = graphene.Schema(query=Query, mutation=Mutation)
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+from django.core.cache import caches
+from django.db import connections
+from django.db.models.signals import post_init
+from graphql.error import GraphQLError
+
+"""
+Throttles GraphQL requests per user using token buckets. Each request is charged its
+estimated cost (see `cost.get_query_cost`) before it is executed. Once it completes, the
+charge is corrected to the number of SQL queries it actually made plus the number of rows
+it loaded, so users whose queries are cheaper or more expensive than estimated are charged
+fairly.
+"""
+
+DEFAULT_MAX_BUCKETS = 10000
+
+
+class ThrottledError(GraphQLError):
+    def __init__(self, retry_after):
+        super().__init__(
+            "Request was throttled. Try again in {:.0f} seconds.".format(retry_after)
+        )
+        self.retry_after = retry_after
+
+
+class LocalThrottleStore(object):
+
+    """ Keeps the `max_size` most recently used buckets in memory. Each process throttles
+    requests separately. """
+
+    def __init__(self, max_size=DEFAULT_MAX_BUCKETS):
+        self.max_size = max_size
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def bucket(self, key):
+        """ Yields a dict whose `bucket` is the `[tokens, updated_at]` of the bucket for
+        `key`, or `None` if it does not exist yet. Whatever `bucket` is set to is saved
+        when the context exits. """
+        with self.lock:
+            state = {"bucket": self.buckets.get(key)}
+            yield state
+            self.buckets[key] = state["bucket"]
+            self.buckets.move_to_end(key)
+            # Forgetting a bucket only gives its user a full one again
+            while len(self.buckets) > self.max_size:
+                self.buckets.popitem(last=False)
+
+
+class DjangoCacheThrottleStore(object):
+
+    """ Keeps buckets in the Django cache named `cache_alias`, so that requests are
+    throttled across processes. Updates are not atomic, so a few concurrent requests
+    may occasionally be charged against the same tokens. """
+
+    def __init__(self, cache_alias="default", key_prefix="graphql_throttle", timeout=3600):
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+
+    @contextmanager
+    def bucket(self, key):
+        cache = caches[self.cache_alias]
+        cache_key = "{}:{}".format(self.key_prefix, key)
+        state = {"bucket": cache.get(cache_key)}
+        yield state
+        cache.set(cache_key, state["bucket"], self.timeout)
+
+
+class CostThrottle(object):
+
+    """ Gives each user a bucket holding up to `capacity` tokens, which refills at
+    `refill_rate` tokens per second. Requests which cost more than the tokens left are
+    rejected. The difference between a request's actual and estimated cost can take a
+    bucket into debt, down to `-capacity` tokens. """
+
+    def __init__(self, capacity, refill_rate, store=None):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.store = store if store is not None else LocalThrottleStore()
+
+    def get_key(self, request):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return "user:{}".format(user.pk)
+        return "ip:{}".format(request.META.get("REMOTE_ADDR"))
+
+    def get_tokens(self, bucket, now):
+        if bucket is None:
+            return self.capacity
+        tokens, updated_at = bucket
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+
+    def consume(self, key, amount):
+        """ Takes `amount` tokens from the bucket for `key`. Raises a `ThrottledError`
+        if there are not enough tokens, in which case none are taken. """
+        # Requests costing more than the capacity are let through once the bucket is
+        # full, as they could never be made otherwise
+        required = min(amount, self.capacity)
+        now = time.time()
+        with self.store.bucket(key) as state:
+            tokens = self.get_tokens(state["bucket"], now)
+            if tokens >= required:
+                state["bucket"] = [tokens - amount, now]
+                return
+        raise ThrottledError((required - tokens) / self.refill_rate)
+
+    def adjust(self, key, amount):
+        """ Takes `amount` more tokens from the bucket for `key`, or returns them if
+        `amount` is negative. """
+        now = time.time()
+        with self.store.bucket(key) as state:
+            tokens = self.get_tokens(state["bucket"], now) - amount
+            state["bucket"] = [max(tokens, -self.capacity), now]
+
+
+class RequestUsage(object):
+
+    """ The actual cost of a request: one token per SQL query, and per row loaded. """
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+    @property
+    def cost(self):
+        return self.queries + self.rows
+
+
+_usage = threading.local()
+# The row counter is only connected while some thread is measuring its usage, so that
+# models are not slowed down otherwise
+_row_counter_lock = threading.Lock()
+_row_counter_users = 0
+
+
+def _count_row(sender, instance, **kwargs):
+    usage = getattr(_usage, "current", None)
+    if usage is not None:
+        usage.rows += 1
+
+
+def _connect_row_counter():
+    global _row_counter_users
+    with _row_counter_lock:
+        if not _row_counter_users:
+            post_init.connect(_count_row, dispatch_uid="graphene_django_plus_count_rows")
+        _row_counter_users += 1
+
+
+def _disconnect_row_counter():
+    global _row_counter_users
+    with _row_counter_lock:
+        _row_counter_users -= 1
+        if not _row_counter_users:
+            post_init.disconnect(dispatch_uid="graphene_django_plus_count_rows")
+
+
+@contextmanager
+def measure_usage():
+    """ Yields a `RequestUsage` which counts the SQL queries made, and the model instances
+    loaded, by the current thread while the context is active. """
+    usage = RequestUsage()
+
+    def count_query(execute, sql, params, many, context):
+        usage.queries += 1
+        return execute(sql, params, many, context)
+
+    previous = getattr(_usage, "current", None)
+    _usage.current = usage
+    _connect_row_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            yield usage
+    finally:
+        _disconnect_row_counter()
+        _usage.current = previous
@@ -7,13 +7,18 @@ from graphene.relay.node import (
     InterfaceOptions,
     OrderedDict,
 )
+from django.core.exceptions import ValidationError
 from graphene_django import DjangoObjectType
 from graphql.error import GraphQLError
 
 from . import filters
 
+from .loaders import InstanceLoader, VisibilityLoader, get_loader
 from .node import PermissionedNode
-from .connections import PermissionedConnectionField
+from .optimizer import optimize_queryset
+from .permissions import get_permission_cache
+from .selections import get_fields
+from .connections import PermissionedConnection, PermissionedConnectionField
 
 from django.conf import settings
 from myagi.settings import production_settings
@@ -43,6 +48,11 @@ class PermissionedType(DjangoObjectType):
             "filter_fields"
         ), "Please use the `filterset_class` option instead of setting `filter_fields` directly."
         cls.permission_class = permission_class
+        # Number of seconds to cache `totalCount` values for. Counts are not cached by default.
+        cls.count_cache_timeout = options.pop("count_cache_timeout", None)
+        # Relative cost of loading an instance of this type, used by `cost.get_query_cost`
+        cls.cost_weight = options.pop("cost_weight", 1)
+        options.setdefault("connection_class", PermissionedConnection)
         # Use `filterset_class` option or create one to prevent complaints from
         # django_filter. Default class will not allow filtering on any fields.
         cls.filterset_class = options.pop(
@@ -50,26 +60,90 @@ class PermissionedType(DjangoObjectType):
         )
         return super().__init_subclass_with_meta__(**options)
 
+    @classmethod
+    def _raise_view_permission_error(cls):
+        raise GraphQLError(
+            f"You do not have permission to view this {cls._meta.model.__name__} instance."
+        )
+
     @classmethod
     def ensure_user_can_view_instance(cls, info, inst):
-        permission_inst = cls.permission_class()
-        permission_inst.queryset = cls._meta.model.objects.all()
-        if not permission_inst.can_view(info.context.user, inst):
-            raise GraphQLError(
-                f"You do not have permission to view this {cls._meta.model.__name__} instance."
-            )
+        can_view = get_permission_cache(info.context).can_view(
+            cls.permission_class, cls._meta.model.objects, info.context.user, inst
+        )
+        if not can_view:
+            cls._raise_view_permission_error()
+
+    @classmethod
+    def load_viewable_instance(cls, info, inst):
+        """ Returns a promise which resolves to `inst` if the user can view it. Checks
+        for all instances requested at one level of the query are made together,
+        using a single call to `can_view_many`. """
+        loader = get_loader(
+            info,
+            ("visibility", cls),
+            lambda: VisibilityLoader(
+                get_permission_cache(info.context),
+                cls.permission_class,
+                cls._meta.model.objects,
+                info.context.user,
+            ),
+        )
+
+        def check_visibility(can_view):
+            if not can_view:
+                cls._raise_view_permission_error()
+            return inst
+
+        return loader.load_instance(inst).then(check_visibility)
+
+    @classmethod
+    def get_node_loader(cls, info):
+        """ Returns the loader used to look up nodes for the field being resolved. Only
+        the columns and related instances needed for the requested fields are loaded. """
+        model = cls._meta.model
+        return get_loader(
+            info,
+            ("node", cls, id(info.field_asts[0])),
+            lambda: InstanceLoader(
+                model,
+                queryset=optimize_queryset(model.objects.all(), cls, get_fields(info)),
+            ),
+        )
 
     @classmethod
     def get_node(cls, info, id):
+        """ Returns the instance with the given `id`, raising an error if it does not
+        exist or the user can not view it. """
+        model = cls._meta.model
         try:
-            inst = cls._meta.model.objects.get(pk=id)
-        except cls._meta.model.DoesNotExist:
-            raise GraphQLError(
-                "Requested {cls._meta.model.__name__} instance does not exist."
-            )
+            inst = model.objects.get(pk=id)
+        except (model.DoesNotExist, ValidationError, ValueError):
+            raise GraphQLError(f"Requested {model.__name__} instance does not exist.")
         cls.ensure_user_can_view_instance(info, inst)
         return inst
 
+    @classmethod
+    def get_node_promise(cls, info, id):
+        """ Returns a promise for the instance with the given `id`. Lookups and permission
+        checks for every node requested in the query are batched. """
+        model = cls._meta.model
+
+        def raise_does_not_exist():
+            raise GraphQLError(f"Requested {model.__name__} instance does not exist.")
+
+        try:
+            pk = model._meta.pk.to_python(id)
+        except ValidationError:
+            raise_does_not_exist()
+
+        def check_instance(inst):
+            if not inst:
+                raise_does_not_exist()
+            return cls.load_viewable_instance(info, inst)
+
+        return cls.get_node_loader(info).load(pk).then(check_instance)
+
 
 # File type that supports file based uploads and replaces url with either
 # local url (if file exists locally) or prod media url
@@ -77,15 +151,13 @@ class DjangoFileType(graphene.Scalar):
     @staticmethod
     def serialize(value):
         try:
-            url = value.url.replace(settings.MEDIA_URL, PROD_MEDIA_URL)
+            url = value.url
         except ValueError:
             return ""
+        media_url = PROD_MEDIA_URL
         if settings.DEBUG and image_file_exists(value):
-            url = value.url.replace(
-                settings.MEDIA_URL,
-                development_settings.LOCALHOST_MEDIA_URL
-            )
-        return url
+            media_url = development_settings.LOCALHOST_MEDIA_URL
+        return url.replace(settings.MEDIA_URL, media_url)
 
     @staticmethod
     def parse_literal(node):
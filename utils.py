@@ -1,7 +1,6 @@
-from graphql.utils.ast_to_dict import ast_to_dict
-
 from .connections import PermissionedConnectionField
 from .node import PermissionedNode
+from .selections import get_fields, merge_selections
 
 
 def create_permissioned_connection_field_for_type(cls):
@@ -15,45 +14,6 @@ def create_permissioned_node_field_for_type(cls, *args, **kwargs):
 
 
 def collect_fields(node, fragments):
-    """Recursively collects fields from the AST
-    Args:
-        node (dict): A node in the AST
-        fragments (dict): Fragment definitions
-    Returns:
-        A dict mapping each field found, along with their sub fields.
-        {'name': {},
-         'sentimentsPerLanguage': {'id': {},
-                                   'name': {},
-                                   'totalSentiments': {}},
-         'slug': {}}
-    """
-
-    field = {}
-
-    if node.get("selection_set"):
-        for leaf in node["selection_set"]["selections"]:
-            if leaf["kind"] == "Field":
-                field.update({leaf["name"]["value"]: collect_fields(leaf, fragments)})
-            elif leaf["kind"] == "FragmentSpread":
-                field.update(
-                    collect_fields(fragments[leaf["name"]["value"]], fragments)
-                )
-
-    return field
-
-
-def get_fields(info):
-    """A convenience function to call collect_fields with info
-    Args:
-        info (ResolveInfo)
-    Returns:
-        dict: Returned from collect_fields
-    """
-
-    fragments = {}
-    node = ast_to_dict(info.field_asts[0])
-
-    for name, value in info.fragments.items():
-        fragments[name] = ast_to_dict(value)
-
-    return collect_fields(node, fragments)
+    """ Returns the fields selected on the AST `node` (see `selections.merge_selections`),
+    following the fragment definitions in `fragments`. """
+    return merge_selections({}, node.selection_set, fragments)
@@ -1,19 +1,282 @@
-import traceback
+from functools import partial
+
+from django.conf import settings
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
+from graphene_django.views import HttpError
 from graphene_file_upload.django import FileUploadGraphQLView
-from raven.contrib.django.raven_compat.models import client as sentry_client
+from graphql.error import GraphQLError
+from graphql.execution import ExecutionResult
+
+from .backend import DEFAULT_MAX_SIZE, CachedDocumentBackend
+from .cost import check_query_cost, get_query_cost
+from .encoding import fast_json_dumps
+from . import error_reporting
+from .instrumentation import finish_request
+from .persisted_queries import InMemoryPersistedQueryStore, resolve_persisted_query
+from .streaming import clear_request_caches, prepare_streaming_query, stream_connection
+from .throttling import ThrottledError, measure_usage
+
+# Shared by every request, as Django creates a new view instance for each one.
+document_backend = CachedDocumentBackend(
+    max_size=getattr(settings, "GRAPHQL_DOCUMENT_CACHE_SIZE", DEFAULT_MAX_SIZE)
+)
+
 
 class ExceptionHandlingGraphQLView(FileUploadGraphQLView):
 
-    def execute_graphql_request(self, *args, **kwargs):
-        """Extracts any exceptions. Sends them to Sentry and also prints them to the console."""
-        result = super().execute_graphql_request(*args, **kwargs)
+    # Store used for persisted queries, or `None` to disable them. If
+    # `persisted_queries_only` is set, only queries which are already in the store
+    # can be executed.
+    persisted_query_store = InMemoryPersistedQueryStore()
+    persisted_queries_only = False
+    # Queries whose estimated cost (see `cost.get_query_cost`) exceeds this are rejected
+    # without being executed. `None` disables the check.
+    max_query_cost = getattr(settings, "GRAPHQL_MAX_QUERY_COST", None)
+    # Charges each request against a per-user budget (see `throttling.CostThrottle`).
+    # `None` disables throttling.
+    throttle = None
+    # Reports errors raised while executing queries (see `error_reporting.ErrorReporter`)
+    error_reporter = error_reporting.error_reporter
+    # Encodes responses with `encoding.fast_json_dumps` unless they are pretty printed
+    fast_json_encoding = getattr(settings, "GRAPHQL_FAST_JSON_ENCODING", True)
+
+    def __init__(self, *args, **kwargs):
+        if kwargs.get("backend") is None:
+            kwargs["backend"] = document_backend
+        for name in (
+            "persisted_query_store",
+            "persisted_queries_only",
+            "max_query_cost",
+            "throttle",
+            "error_reporter",
+            "fast_json_encoding",
+        ):
+            if name in kwargs:
+                setattr(self, name, kwargs.pop(name))
+        super().__init__(*args, **kwargs)
+
+    def get_persisted_query(self, request, data, query):
+        """ Returns the query text to execute, looking it up in `persisted_query_store`
+        if the request only contains its hash. """
+        if self.persisted_query_store is None:
+            return query
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        return resolve_persisted_query(
+            self.persisted_query_store,
+            query,
+            extensions,
+            whitelist_only=self.persisted_queries_only,
+        )
+
+    def check_query_cost(self, request, query, variables, operation_name):
+        """ Raises a `QueryCostError` if the query is too expensive to execute. Returns
+        the estimated cost of the query, or 0 if it is invalid. """
+        if (self.max_query_cost is None and self.throttle is None) or not query:
+            return 0
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            # Reported when the query is executed
+            return 0
+        if getattr(document, "validation_errors", None):
+            return 0
+        if self.max_query_cost is None:
+            return get_query_cost(
+                self.schema,
+                document.document_ast,
+                operation_name=operation_name,
+                variables=variables,
+            )
+        return check_query_cost(
+            self.schema,
+            document.document_ast,
+            self.max_query_cost,
+            operation_name=operation_name,
+            variables=variables,
+        )
+
+    def json_encode(self, request, d, pretty=False):
+        if (
+            not self.fast_json_encoding
+            or self.pretty
+            or pretty
+            or request.GET.get("pretty")
+        ):
+            return super().json_encode(request, d, pretty)
+        encoded = fast_json_dumps(d)
+        if self.batch and isinstance(encoded, bytes):
+            # The responses of batched requests are joined as strings
+            return encoded.decode("utf-8")
+        return encoded
+
+    def get_response(self, request, data, show_graphiql=False):
+        """ Same as `GraphQLView.get_response`, but includes the `extensions` of the result
+        and responds to throttled requests with a 429. """
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if not execution_result:
+            return None, 200
+
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.invalid:
+            throttled = any(
+                isinstance(e, ThrottledError) for e in execution_result.errors or ()
+            )
+            status_code = 429 if throttled else 400
+        else:
+            response["data"] = execution_result.data
+        extensions = getattr(execution_result, "extensions", None)
+        if extensions:
+            response["extensions"] = extensions
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, *args, **kwargs
+    ):
+        """Extracts any exceptions. Sends them to Sentry and also prints them to the console,
+        from a background thread (see `error_reporter`)."""
+        try:
+            query = self.get_persisted_query(request, data, query)
+        except GraphQLError as e:
+            # Expected as part of the persisted query protocol, so not reported
+            return ExecutionResult(errors=[e])
+        return self.execute_checked(
+            request,
+            query,
+            variables,
+            operation_name,
+            partial(
+                super().execute_graphql_request,
+                request,
+                data,
+                query,
+                variables,
+                operation_name,
+                *args,
+                **kwargs
+            ),
+        )
+
+    def execute_checked(self, request, query, variables, operation_name, execute):
+        """ Calls `execute` to execute the query, once it has passed the cost check and
+        been charged to the throttle. Completes the profile of the request and reports
+        the errors of the result. """
+        try:
+            cost = self.check_query_cost(request, query, variables, operation_name)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        if self.throttle is None:
+            result = execute()
+        else:
+            key = self.throttle.get_key(request)
+            try:
+                self.throttle.consume(key, cost)
+            except ThrottledError as e:
+                return ExecutionResult(errors=[e], invalid=True)
+            try:
+                with measure_usage() as usage:
+                    result = execute()
+            finally:
+                # Charge what the request actually cost rather than the estimate, even
+                # if it failed
+                self.throttle.adjust(key, usage.cost - cost)
+        profile = finish_request(request)
+        if result is not None and profile is not None and profile.extensions:
+            result.extensions = dict(result.extensions or {}, **profile.extensions)
         if result and result.errors:
             for error in result.errors:
-                try:
-                    raise error.original_error
-                except Exception as e:
-                    sentry_client.captureException()
-                    tb = traceback.format_exc()
-                    print("Exception was caught by GraphQL Core. Original error:")
-                    print(tb)
+                self.error_reporter.report(error, request)
         return result
+
+
+class StreamingConnectionView(ExceptionHandlingGraphQLView):
+
+    """ Streams every edge of the (single) connection selected by a query as JSON lines,
+    fetching `chunk_size` edges at a time so that memory use stays flat. The last line
+    contains the `endCursor` of the connection; if it is missing, the stream was cut off
+    and can be resumed by passing the cursor of the last edge received as `after`. A line
+    containing `errors` is written if the query fails part way through. """
+
+    chunk_size = 100
+
+    def __init__(self, *args, **kwargs):
+        if "chunk_size" in kwargs:
+            self.chunk_size = kwargs.pop("chunk_size")
+        super().__init__(*args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+            data = self.parse_body(request)
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+            after = request.GET.get("after") or data.get("after")
+            try:
+                query = self.get_persisted_query(request, data, query)
+                if not query:
+                    raise GraphQLError("Must provide query string.")
+                query, response_key = prepare_streaming_query(query, operation_name)
+                document = self.get_backend(request).document_from_string(
+                    self.schema, query
+                )
+            except GraphQLError as e:
+                raise HttpError(HttpResponseBadRequest(str(e)))
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+        def execute(page_variables):
+            clear_request_caches(request)
+            # Each page is checked, charged and reported like a request of its own
+            return self.execute_checked(
+                request,
+                query,
+                page_variables,
+                operation_name,
+                lambda: document.execute(
+                    root=self.get_root_value(request),
+                    variables=page_variables,
+                    operation_name=operation_name,
+                    context=self.get_context(request),
+                    middleware=self.get_middleware(request),
+                ),
+            )
+
+        lines = (
+            self.encode_line(request, line)
+            for line in stream_connection(
+                execute, response_key, variables, after, self.chunk_size
+            )
+        )
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+    def encode_line(self, request, line):
+        encoded = self.json_encode(request, self.format_line(line))
+        if isinstance(encoded, bytes):
+            return encoded + b"\n"
+        return encoded + "\n"
+
+    def format_line(self, line):
+        if "errors" in line:
+            return {"errors": [self.format_error(e) for e in line["errors"]]}
+        return line